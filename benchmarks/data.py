@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+COLUMN_KINDS = ('int', 'float', 'str', 'datetime', 'bool')
+
+# synthetic DF of rows x cols, cycling through COLUMN_KINDS so every export path sees a realistic mix of dtypes
+# the same seed always gives the same frame, so runs are comparable
+def make_frame(rows:int, cols:int, seed:int=0, kinds:tuple=COLUMN_KINDS, str_len:int=12, null_ratio:float=0.0) -> pd.DataFrame:
+	rng = np.random.default_rng(seed)
+	words = np.array([''.join(rng.choice(list('abcdefghijklmnopqrstuvwxyz '), str_len)).strip() or 'x' for _ in range(1000)], dtype=object)
+
+	columns = {}
+	for col_num in range(cols):
+		kind = kinds[col_num % len(kinds)]
+		col_name = f'{kind}_{col_num}'
+
+		if kind == 'int':
+			values = rng.integers(0, 10**9, rows)
+		elif kind == 'float':
+			values = np.round(rng.standard_normal(rows) * 1000, 4)
+		elif kind == 'str':
+			values = words[rng.integers(0, len(words), rows)]
+		elif kind == 'datetime':
+			values = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365 * 86400, rows), unit='s')
+		elif kind == 'bool':
+			values = rng.integers(0, 2, rows).astype(bool)
+		else:
+			raise ValueError(f'Invalid column kind. Supported: {list(COLUMN_KINDS)}')
+
+		col = pd.Series(values, name=col_name)
+		if null_ratio and kind in ('float', 'str'):
+			col[rng.random(rows) < null_ratio] = None
+		columns[col_name] = col
+
+	return pd.DataFrame(columns)
@@ -0,0 +1,510 @@
+import io
+import re
+import time
+import base64
+import hashlib
+import random
+import threading
+import pandas as pd
+from datetime import datetime, timedelta
+
+'''
+Offline stand-ins for the BigQuery client, the GCS storage client and the Drive service.
+They implement only the calls python_utils makes, keep uploaded data in memory
+and sleep for an injectable latency so network-bound code paths can be timed without credentials.
+'''
+
+# simulated network cost: a fixed delay per call plus an optional transfer time per byte
+# every call is recorded so per-call latency can be reported next to the overall timings
+class Fake_Latency:
+	def __init__(self, seconds:float=0.0, jitter:float=0.0, bytes_per_second:float=None, seed:int=0):
+		self.seconds = seconds
+		self.jitter = jitter
+		self.bytes_per_second = bytes_per_second
+		self.calls = []
+		self._random = random.Random(seed)
+		self._lock = threading.Lock()
+
+	def wait(self, call:str, nbytes:int=0):
+		with self._lock:
+			delay = self.seconds + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+		if self.bytes_per_second:
+			delay += nbytes / self.bytes_per_second
+
+		start = time.perf_counter()
+		if delay > 0:
+			time.sleep(delay)
+		with self._lock:
+			self.calls.append((call, time.perf_counter() - start, nbytes))
+
+	def reset(self):
+		with self._lock:
+			self.calls = []
+
+# ============
+# = BigQuery =
+# ============
+
+class Fake_Query_Job:
+	def __init__(self, results_df:pd.DataFrame, latency:Fake_Latency, exec_seconds:float=0.0):
+		self.job_id = f'fake_{id(self)}'
+		self.created = datetime.now()
+		self.started = self.created
+		self.ended = self.started + timedelta(seconds=exec_seconds)
+		self.total_bytes_processed = int(results_df.memory_usage(deep=False).sum())
+		self.total_bytes_billed = max(self.total_bytes_processed, 10 * 1024**2)
+		self.slot_millis = int(exec_seconds * 1000)
+		self.cache_hit = False
+		self._results_df = results_df
+		self._latency = latency
+		self._page_size = None
+
+	def done(self) -> bool:
+		return datetime.now() >= self.ended
+
+	def cancel(self):
+		self.ended = datetime.now()
+
+	def result(self, page_size:int=None, **kwargs):
+		remaining = (self.ended - datetime.now()).total_seconds()
+		if remaining > 0:
+			time.sleep(remaining)
+		self._page_size = page_size or self._page_size
+		return self
+
+	def to_dataframe(self, *args, **kwargs) -> pd.DataFrame:
+		self.result()
+		self._latency.wait('query.to_dataframe', self.total_bytes_processed)
+		return self._results_df.copy()
+
+	# one page per page_size rows, each paying the download latency
+	def to_dataframe_iterable(self, *args, **kwargs):
+		self.result()
+		page_size = self._page_size or len(self._results_df) or 1
+		for start in range(0, len(self._results_df), page_size):
+			page_df = self._results_df.iloc[start:start + page_size]
+			self._latency.wait('query.page', int(page_df.memory_usage(deep=False).sum()))
+			yield page_df.copy()
+
+class Fake_Load_Job:
+	def __init__(self, latency:Fake_Latency, output_rows:int=None, input_files:int=1, input_file_bytes:int=0):
+		self._latency = latency
+		self.job_id = f'fake_load_{id(self)}'
+		self.error_result = None
+		self.output_rows = output_rows
+		self.output_bytes = input_file_bytes
+		self.input_files = input_files
+		self.input_file_bytes = input_file_bytes
+
+	def done(self, *args, **kwargs) -> bool:
+		return True
+
+	def result(self, *args, **kwargs):
+		self._latency.wait('load.result')
+		return self
+
+# every query returns results_df, after exec_seconds of simulated execution
+class Fake_BQ_Client:
+	def __init__(self, results_df:pd.DataFrame, latency:Fake_Latency=None, exec_seconds:float=0.0):
+		self.results_df = results_df
+		self.latency = latency or Fake_Latency()
+		self.exec_seconds = exec_seconds
+		self.loaded_bytes = 0
+		self.load_uris = []
+
+	def query(self, query:str, job_config=None, **kwargs) -> Fake_Query_Job:
+		self.latency.wait('query')
+		return Fake_Query_Job(self.results_df, self.latency, 0.0 if getattr(job_config, 'dry_run', False) else self.exec_seconds)
+
+	def load_table_from_file(self, file_obj, destination, job_config=None, **kwargs) -> Fake_Load_Job:
+		nbytes = len(file_obj.read())
+		self.loaded_bytes += nbytes
+		self.latency.wait('load_table_from_file', nbytes)
+		return Fake_Load_Job(self.latency)
+
+	def load_table_from_dataframe(self, df:pd.DataFrame, destination, job_config=None, **kwargs) -> Fake_Load_Job:
+		nbytes = int(df.memory_usage(deep=False).sum())
+		self.loaded_bytes += nbytes
+		self.latency.wait('load_table_from_dataframe', nbytes)
+		return Fake_Load_Job(self.latency, len(df))
+
+	def load_table_from_uri(self, source_uris, destination, job_config=None, **kwargs) -> Fake_Load_Job:
+		self.latency.wait('load_table_from_uri')
+		self.load_uris.append([source_uris] if isinstance(source_uris, str) else list(source_uris))
+		return Fake_Load_Job(self.latency, input_files=len(self.load_uris[-1]))
+
+# =======
+# = GCS =
+# =======
+
+# like a real Blob, size and checksums are only known after a call that returns the object's metadata:
+# an upload, compose, reload or listing - not after closing a blob writer
+class Fake_Blob:
+	def __init__(self, bucket, name:str, loaded:bool=False):
+		self.bucket = bucket
+		self.name = name
+		self._loaded = loaded
+
+	def exists(self, *args, **kwargs) -> bool:
+		self.bucket.latency.wait('blob.exists')
+		return self.name in self.bucket.objects
+
+	def upload_from_file(self, file_obj, content_type:str=None, **kwargs):
+		data = file_obj.read()
+		self.bucket.latency.wait('blob.upload_from_file', len(data))
+		with self.bucket.lock:
+			self.bucket.objects[self.name] = data
+		self._loaded = True
+
+	def upload_from_filename(self, filename:str, content_type:str=None, **kwargs):
+		with open(filename, 'rb') as file_obj:
+			self.upload_from_file(file_obj, content_type)
+
+	def upload_from_string(self, data, content_type:str=None, **kwargs):
+		data = data.encode('utf-8') if isinstance(data, str) else data
+		self.bucket.latency.wait('blob.upload_from_string', len(data))
+		with self.bucket.lock:
+			self.bucket.objects[self.name] = data
+		self._loaded = True
+
+	def open(self, mode:str='rb', chunk_size:int=None, content_type:str=None, **kwargs):
+		if mode != 'wb':
+			raise ValueError('Fake_Blob only supports opening for writing')
+		return Fake_Blob_Writer(self, chunk_size or 100 * 1024**2)
+
+	def compose(self, sources:list, **kwargs):
+		with self.bucket.lock:
+			data = b''.join(self.bucket.objects[source.name] for source in sources)
+		self.bucket.latency.wait('blob.compose')
+		with self.bucket.lock:
+			self.bucket.objects[self.name] = data
+		self._loaded = True
+
+	def reload(self, *args, **kwargs):
+		self.bucket.latency.wait('blob.reload')
+		self._loaded = True
+
+	def download_as_bytes(self, *args, **kwargs) -> bytes:
+		data = self.bucket.objects[self.name]
+		self.bucket.latency.wait('blob.download_as_bytes', len(data))
+		return data
+
+	def delete(self, *args, **kwargs):
+		self.bucket.latency.wait('blob.delete')
+		with self.bucket.lock:
+			self.bucket.objects.pop(self.name, None)
+
+	@property
+	def size(self) -> int:
+		return len(self.bucket.objects.get(self.name, b'')) if self._loaded else None
+
+	@property
+	def md5_hash(self) -> str:
+		return base64.b64encode(hashlib.md5(self.bucket.objects.get(self.name, b'')).digest()).decode('utf-8') if self._loaded else None
+
+	@property
+	def crc32c(self) -> str:
+		return None
+
+# resumable upload: every full chunk is sent as it fills up, the object appears on close
+# leaving a with block on an exception terminates the upload instead, like BlobWriter.__exit__
+class Fake_Blob_Writer(io.BufferedIOBase):
+	def __init__(self, blob:Fake_Blob, chunk_size:int):
+		self._blob = blob
+		self._chunk_size = chunk_size
+		self._pending = bytearray()
+		self._sent = []
+
+	def writable(self) -> bool:
+		return True
+
+	def write(self, data) -> int:
+		self._pending += data
+		while len(self._pending) >= self._chunk_size:
+			self._send(self._chunk_size)
+		return len(data)
+
+	def close(self):
+		if self.closed:
+			return
+		self._send(len(self._pending))
+		with self._blob.bucket.lock:
+			self._blob.bucket.objects[self._blob.name] = b''.join(self._sent)
+		super().close()
+
+	def terminate(self):
+		self._pending.clear()
+		self._sent.clear()
+		super().close()
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		if exc_type is not None:
+			self.terminate()
+		else:
+			self.close()
+
+	def _send(self, nbytes:int):
+		chunk = bytes(self._pending[:nbytes])
+		del self._pending[:nbytes]
+		self._blob.bucket.latency.wait('blob_writer.chunk', len(chunk))
+		self._sent.append(chunk)
+
+class Fake_Bucket:
+	def __init__(self, name:str, latency:Fake_Latency):
+		self.name = name
+		self.latency = latency
+		self.objects = {}
+		self.lock = threading.Lock()
+
+	def blob(self, blob_name:str) -> Fake_Blob:
+		return Fake_Blob(self, blob_name)
+
+	# delimiter='/' lists only the objects directly under prefix, like GCS
+	def list_blobs(self, prefix:str=None, delimiter:str=None, **kwargs):
+		self.latency.wait('bucket.list_blobs')
+		prefix = prefix or ''
+		with self.lock:
+			names = sorted(
+				name for name in self.objects
+				if name.startswith(prefix) and not (delimiter and delimiter in name[len(prefix):])
+			)
+		return [Fake_Blob(self, name, loaded=True) for name in names]
+
+class Fake_Storage_Client:
+	def __init__(self, latency:Fake_Latency=None):
+		self.latency = latency or Fake_Latency()
+		self.buckets = {}
+		self._lock = threading.Lock()
+
+	def bucket(self, bucket_id:str) -> Fake_Bucket:
+		with self._lock:
+			if bucket_id not in self.buckets:
+				self.buckets[bucket_id] = Fake_Bucket(bucket_id, self.latency)
+			return self.buckets[bucket_id]
+
+	def list_blobs(self, bucket_id, prefix:str=None, delimiter:str=None, **kwargs):
+		bucket = bucket_id if isinstance(bucket_id, Fake_Bucket) else self.bucket(bucket_id)
+		return bucket.list_blobs(prefix=prefix, delimiter=delimiter)
+
+# =========
+# = Drive =
+# =========
+
+class Fake_Http_Response:
+	def __init__(self, status:int):
+		self.status = status
+
+# shaped like googleapiclient.errors.HttpError: resp.status and the JSON error content
+class Fake_Http_Error(Exception):
+	def __init__(self, status:int, reason:str):
+		super().__init__(f'<HttpError {status}: {reason}>')
+		self.resp = Fake_Http_Response(status)
+		self.content = f'{{"error": {{"errors": [{{"reason": "{reason}"}}]}}}}'.encode('utf-8')
+
+class Fake_Drive_Request:
+	def __init__(self, latency:Fake_Latency, call:str, response, nbytes:int=0, quota=None):
+		self._latency = latency
+		self._call = call
+		self._response = response
+		self._nbytes = nbytes
+		self._quota = quota
+
+	def execute(self, *args, **kwargs):
+		if self._quota and not self._quota():
+			self._latency.wait(self._call)
+			raise Fake_Http_Error(403, 'userRateLimitExceeded')
+		self._latency.wait(self._call, self._nbytes)
+		return self._response() if callable(self._response) else self._response
+
+# media requests are sent by MediaIoBaseDownload through request.http, one Range request per chunk
+class Fake_Drive_Media_Request:
+	def __init__(self, service, file_id:str):
+		self.uri = f'https://fake.googleapis.com/drive/v3/files/{file_id}?alt=media'
+		self.headers = {}
+		self.http = Fake_Drive_Http(service, file_id)
+
+class Fake_Http_Headers(dict):
+	def __init__(self, status:int, headers:dict):
+		super().__init__(headers)
+		self.status = status
+
+class Fake_Drive_Http:
+	def __init__(self, service, file_id:str):
+		self._service = service
+		self._file_id = file_id
+
+	def request(self, uri:str, method:str='GET', headers:dict=None, **kwargs):
+		data = self._service.drive_files[self._file_id]['data']
+		start, end = (int(value) for value in re.match(r'bytes=(\d+)-(\d+)', (headers or {})['range']).groups())
+		if start >= len(data):
+			self._service.latency.wait('files.get_media')
+			return Fake_Http_Headers(416, {'content-range': f'bytes */{len(data)}'}), b''
+
+		content = data[start:end + 1]
+		self._service.latency.wait('files.get_media', len(content))
+		return Fake_Http_Headers(206, {'content-range': f'bytes {start}-{start + len(content) - 1}/{len(data)}'}), content
+
+class Fake_Upload_Progress:
+	def __init__(self, resumable_progress:int, total_size:int):
+		self.resumable_progress = resumable_progress
+		self.total_size = total_size
+
+# a resumable upload, one media_body.chunksize() chunk per next_chunk() like googleapiclient's HttpRequest
+# sessions live on the service keyed by resumable_uri, so a new request can pick one up after _in_error_state is set
+class Fake_Drive_Upload_Request:
+	def __init__(self, service, call:str, file_id:str, body:dict, media_body):
+		self._service = service
+		self._call = call
+		self._file_id = file_id
+		self._body = body
+		self._media = media_body
+		self.resumable_uri = None
+		self.resumable_progress = 0
+		self._in_error_state = False
+
+	def next_chunk(self, num_retries:int=0):
+		service = self._service
+		size = self._media.size()
+
+		if self.resumable_uri is None:
+			service.latency.wait(self._call)
+			if not service.allow_write():
+				raise Fake_Http_Error(403, 'userRateLimitExceeded')
+			self.resumable_uri = service.start_session()
+		elif self._in_error_state:
+			# ask how much of the session arrived, like the client's empty PUT with Content-Range: bytes */size
+			service.latency.wait(self._call)
+			if self.resumable_uri not in service.upload_sessions:
+				raise Fake_Http_Error(404, 'notFound')
+			self.resumable_progress = len(service.upload_sessions[self.resumable_uri])
+			self._in_error_state = False
+
+		data = self._media.getbytes(self.resumable_progress, self._media.chunksize())
+		data = data.encode('utf-8') if isinstance(data, str) else data
+		service.latency.wait(self._call, len(data))
+		self.resumable_progress = service.append_session(self.resumable_uri, self.resumable_progress, data)
+
+		if self.resumable_progress < size:
+			return Fake_Upload_Progress(self.resumable_progress, size), None
+		return None, service.store(self._file_id, self._body, service.upload_sessions.pop(self.resumable_uri))
+
+	def execute(self, num_retries:int=0, **kwargs) -> dict:
+		response = None
+		while response is None:
+			_, response = self.next_chunk(num_retries)
+		return response
+
+class Fake_Drive_Files:
+	def __init__(self, service):
+		self._service = service
+
+	def list(self, q:str='', pageSize:int=100, pageToken:str=None, **kwargs) -> Fake_Drive_Request:
+		return Fake_Drive_Request(self._service.latency, 'files.list', lambda: self._service.search(q, pageSize, pageToken))
+
+	def get(self, fileId:str=None, **kwargs) -> Fake_Drive_Request:
+		return Fake_Drive_Request(self._service.latency, 'files.get', lambda: self._service.metadata(fileId))
+
+	def get_media(self, fileId:str=None, **kwargs) -> Fake_Drive_Media_Request:
+		return Fake_Drive_Media_Request(self._service, fileId)
+
+	def create(self, body:dict=None, media_body=None, **kwargs):
+		if media_body is not None:
+			return Fake_Drive_Upload_Request(self._service, 'files.create', None, body, media_body)
+		return Fake_Drive_Request(self._service.latency, 'files.create', lambda: self._service.store(None, body, b''), 0, self._service.allow_write)
+
+	def update(self, fileId:str=None, body:dict=None, media_body=None, **kwargs):
+		if media_body is not None:
+			return Fake_Drive_Upload_Request(self._service, 'files.update', fileId, body, media_body)
+		return Fake_Drive_Request(self._service.latency, 'files.update', lambda: self._service.store(fileId, body, None), 0, self._service.allow_write)
+
+# a flat in-memory Drive: {file id: {'id', 'name', 'parents', 'mimeType', 'modifiedTime', 'data'}}
+# files().list understands the "'<id>' in parents" and "name='<name>'" terms used by Google_Drive
+# write_quota: creates and updates allowed per second; writes over the quota fail with a 403 userRateLimitExceeded
+class Fake_Drive_Service:
+	def __init__(self, latency:Fake_Latency=None, write_quota:float=None):
+		self.latency = latency or Fake_Latency()
+		self.write_quota = write_quota
+		self.rejected_writes = 0
+		self.drive_files = {}
+		self.upload_sessions = {}
+		self._next_id = 0
+		self._next_session = 0
+		self._writes = []
+		self._lock = threading.Lock()
+
+	def allow_write(self) -> bool:
+		if not self.write_quota:
+			return True
+		with self._lock:
+			now = time.monotonic()
+			self._writes = [written_at for written_at in self._writes if now - written_at < 1.0]
+			if len(self._writes) >= self.write_quota:
+				self.rejected_writes += 1
+				return False
+			self._writes.append(now)
+			return True
+
+	def files(self) -> Fake_Drive_Files:
+		return Fake_Drive_Files(self)
+
+	def search(self, query:str, page_size:int=100, page_token:str=None) -> dict:
+		parent = re.search(r"'([^']+)' in parents", query or '')
+		name = re.search(r"name\s*=\s*'((?:[^'\\]|\\.)*)'", query or '')
+		folders_only = 'mimeType=' in (query or '').replace(' ', '') and 'folder' in query
+
+		with self._lock:
+			matches = [
+				{key: value for key, value in drive_file.items() if key != 'data'}
+				for drive_file in self.drive_files.values()
+				if (not parent or parent.group(1) in drive_file['parents'])
+				and (not name or drive_file['name'] == name.group(1).replace("\\'", "'"))
+				and (not folders_only or drive_file['mimeType'] == 'application/vnd.google-apps.folder')
+			]
+
+		start = int(page_token or 0)
+		response = {'files': matches[start:start + page_size]}
+		if start + page_size < len(matches):
+			response['nextPageToken'] = str(start + page_size)
+		return response
+
+	def metadata(self, file_id:str) -> dict:
+		with self._lock:
+			drive_file = self.drive_files[file_id]
+			return {
+				'id': file_id,
+				'name': drive_file['name'],
+				'mimeType': drive_file['mimeType'],
+				'size': str(len(drive_file['data'])),
+				'md5Checksum': hashlib.md5(drive_file['data']).hexdigest()
+			}
+
+	def start_session(self) -> str:
+		with self._lock:
+			self._next_session += 1
+			session_uri = f'https://fake.googleapis.com/upload/drive/v3/files?upload_id={self._next_session}'
+			self.upload_sessions[session_uri] = b''
+			return session_uri
+
+	# bytes received so far; a chunk that overlaps what already arrived only adds its new tail
+	def append_session(self, session_uri:str, offset:int, data:bytes) -> int:
+		with self._lock:
+			received = self.upload_sessions[session_uri]
+			self.upload_sessions[session_uri] = received[:offset] + data
+			return len(self.upload_sessions[session_uri])
+
+	def store(self, file_id:str, body:dict, data:bytes) -> dict:
+		with self._lock:
+			if file_id is None:
+				self._next_id += 1
+				file_id = f'fake_file_{self._next_id}'
+				self.drive_files[file_id] = {
+					'id': file_id,
+					'name': body['name'],
+					'parents': body.get('parents', []),
+					'mimeType': body.get('mimeType', 'application/octet-stream'),
+				}
+			drive_file = self.drive_files[file_id]
+			drive_file['modifiedTime'] = datetime.now().isoformat()
+			if data is not None:
+				drive_file['data'] = data
+			return {'id': file_id, 'name': drive_file['name']}
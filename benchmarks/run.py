@@ -0,0 +1,399 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from datetime import datetime
+from benchmarks.data import make_frame
+from benchmarks.fakes import Fake_Latency, Fake_BQ_Client, Fake_Storage_Client, Fake_Drive_Service
+from python_utils import bigquery
+from python_utils.backup import bq_to_csv
+from python_utils.gcs_bucket import file_to_bucket, bin_file_to_bucket, bq_to_bucket, bucket_file_to_bq, bucket_files_to_bq
+from python_utils.google_drive import Google_Drive, Rate_Limiter
+
+'''
+Offline benchmarks for the export and upload paths.
+
+Run from the repository root:
+	python -m benchmarks.run --rows 100000 --cols 12 --output bench.json
+	python -m benchmarks.run --cases csv,bucket --latency 0.05 --bandwidth 20 --compare bench.json
+'''
+
+# everything a case needs: the synthetic DF, the fake clients and the run options
+class Bench_Context:
+	def __init__(self, args):
+		self.args = args
+		self.df = make_frame(args.rows, args.cols, seed=args.seed)
+		self.slice_row = args.slice_row
+		self.workers = args.workers
+		self.latency = Fake_Latency(args.latency, args.jitter, args.bandwidth * 1024**2 if args.bandwidth else None, seed=args.seed)
+		self.tmp_dir = tempfile.mkdtemp(prefix='python_utils_bench_')
+		self.sql_script = os.path.join(self.tmp_dir, 'bench.sql')
+		with open(self.sql_script, 'w') as sql_file:
+			sql_file.write('SELECT * FROM `project.dataset.table` WHERE dept LIKE cur_dept')
+		self._local_csv = None
+
+	# the DF written once as a local CSV, for the cases that upload a file from disk
+	def local_csv(self) -> str:
+		if self._local_csv is None:
+			self._local_csv = os.path.join(self.tmp_dir, 'bench_local.csv')
+			self.df.to_csv(self._local_csv, index=False)
+		return self._local_csv
+
+	def close(self):
+		shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+# =========
+# = Cases =
+# =========
+
+# each case does its untimed setup and returns the call to time
+# the call returns the number of bytes it produced or uploaded
+
+def _buffer_bytes(file_data) -> int:
+	total_bytes = 0
+	for _, file_buffer, *_ in file_data:
+		file_buffer.seek(0, os.SEEK_END)
+		total_bytes += file_buffer.tell()
+		file_buffer.seek(0)
+	return total_bytes
+
+def _dir_bytes(dir_path:str) -> int:
+	return sum(entry.stat().st_size for entry in os.scandir(dir_path) if entry.is_file())
+
+def bench_bq_to_df(ctx:Bench_Context):
+	bq_client = Fake_BQ_Client(ctx.df, ctx.latency, ctx.args.exec_seconds)
+	def run():
+		results_df = bigquery.bq_to_df(bq_client, ctx.sql_script, [('cur_dept', "'1%'")])
+		return int(results_df.memory_usage(deep=False).sum())
+	return run
+
+def bench_bq_to_df_iter(ctx:Bench_Context):
+	bq_client = Fake_BQ_Client(ctx.df, ctx.latency, ctx.args.exec_seconds)
+	def run():
+		return sum(int(chunk_df.memory_usage(deep=False).sum()) for chunk_df in bigquery.bq_to_df_iter(bq_client, ctx.sql_script, ctx.slice_row))
+	return run
+
+def bench_df_to_bq(ctx:Bench_Context):
+	bq_client = Fake_BQ_Client(ctx.df, ctx.latency)
+	def run():
+		bigquery.df_to_bq(bq_client, ctx.df, 'project.dataset.table', 't', chunk_row=ctx.slice_row, workers=ctx.workers)
+		return bq_client.loaded_bytes
+	return run
+
+def _bench_local_export(ctx:Bench_Context, export, file_ext:str, **kwargs):
+	out_dir = tempfile.mkdtemp(dir=ctx.tmp_dir)
+	def run():
+		export(ctx.df, ctx.slice_row, os.path.join(out_dir, f'bench{file_ext}'), workers=ctx.workers, **kwargs)
+		total_bytes = _dir_bytes(out_dir)
+		shutil.rmtree(out_dir, ignore_errors=True)
+		return total_bytes
+	return run
+
+def bench_df_to_csv(ctx:Bench_Context):
+	return _bench_local_export(ctx, bigquery.df_to_csv, '.csv')
+
+def bench_df_to_csv_arrow(ctx:Bench_Context):
+	return _bench_local_export(ctx, bigquery.df_to_csv, '.csv', encoder='arrow')
+
+def bench_df_to_excel(ctx:Bench_Context):
+	return _bench_local_export(ctx, bigquery.df_to_excel, '.xlsx')
+
+def bench_df_to_csv_bin(ctx:Bench_Context):
+	return lambda: _buffer_bytes(bigquery.df_to_csv_bin(ctx.df, ctx.slice_row, 'bench.csv', workers=ctx.workers))
+
+def bench_df_to_excel_bin(ctx:Bench_Context):
+	return lambda: _buffer_bytes(bigquery.df_to_excel_bin(ctx.df, ctx.slice_row, 'bench.xlsx', workers=ctx.workers))
+
+def bench_df_to_csv_bin_iter(ctx:Bench_Context):
+	# buffers are measured and dropped one at a time, as an uploader would
+	return lambda: sum(_buffer_bytes([cur_file]) for cur_file in bigquery.df_to_csv_bin_iter(ctx.df, ctx.slice_row, 'bench.csv'))
+
+def bench_df_to_parquet_bin(ctx:Bench_Context):
+	return lambda: _buffer_bytes(bigquery.df_to_parquet_bin(ctx.df, ctx.slice_row, 'bench.parquet', workers=ctx.workers))
+
+def bench_df_to_avro_bin(ctx:Bench_Context):
+	return lambda: _buffer_bytes(bigquery.df_to_avro_bin(ctx.df, ctx.slice_row, 'bench.avro', workers=ctx.workers))
+
+def _bench_bq_to_csv(ctx:Bench_Context, **kwargs):
+	bq_client = Fake_BQ_Client(ctx.df, ctx.latency, ctx.args.exec_seconds)
+	def run():
+		csv_files = bq_to_csv(bq_client, ctx.sql_script, ctx.slice_row, 'bench.csv', **kwargs)
+		return sum(_buffer_bytes([cur_file]) for cur_file in csv_files)
+	return run
+
+def bench_bq_to_csv(ctx:Bench_Context):
+	return _bench_bq_to_csv(ctx)
+
+def bench_bq_to_csv_stream(ctx:Bench_Context):
+	return _bench_bq_to_csv(ctx, stream=True)
+
+def bench_bq_to_csv_lazy(ctx:Bench_Context):
+	return _bench_bq_to_csv(ctx, stream=True, lazy=True)
+
+def _bench_file_to_bucket(ctx:Bench_Context, mode:str='t', **kwargs):
+	storage_client = Fake_Storage_Client(ctx.latency)
+	file_path = ctx.local_csv()
+	if mode == 's':
+		# the object is already in the bucket, so the timed run is the unchanged check
+		file_to_bucket(storage_client, 'bench_bucket', 'bench', '.csv', file_path, 't')
+	def run():
+		# index_ttl=0 lists the bucket on every run instead of reusing the previous run's listing
+		file_to_bucket(storage_client, 'bench_bucket', 'bench', '.csv', file_path, mode, index_ttl=0, **kwargs)
+		return os.path.getsize(file_path)
+	return run
+
+def bench_file_to_bucket(ctx:Bench_Context):
+	return _bench_file_to_bucket(ctx)
+
+def bench_file_to_bucket_composite(ctx:Bench_Context):
+	# 8 parts whatever the file size, so the parts are uploaded and composed at any --rows
+	part_size = -(-os.path.getsize(ctx.local_csv()) // 8)
+	return _bench_file_to_bucket(ctx, composite_threshold=1, composite_part_size=part_size, composite_workers=max(ctx.workers, 1))
+
+def bench_file_to_bucket_sync(ctx:Bench_Context):
+	return _bench_file_to_bucket(ctx, mode='s')
+
+def _bench_bucket_load(ctx:Bench_Context, load):
+	bq_client = Fake_BQ_Client(ctx.df, ctx.latency)
+	parquet_files = bigquery.df_to_parquet_bin(ctx.df, ctx.slice_row, 'bench.parquet')
+	bucket_filepaths = [f'bench_bucket/bench/{file_name}' for file_name, _ in parquet_files]
+	total_bytes = _buffer_bytes(parquet_files)
+	def run():
+		load(bq_client, bucket_filepaths)
+		return total_bytes
+	return run
+
+def bench_bucket_file_to_bq(ctx:Bench_Context):
+	def load(bq_client, bucket_filepaths):
+		for bucket_filepath in bucket_filepaths:
+			bucket_file_to_bq(bq_client, bucket_filepath, 'project', 'dataset', 'table', 'a')
+	return _bench_bucket_load(ctx, load)
+
+def bench_bucket_files_to_bq(ctx:Bench_Context):
+	return _bench_bucket_load(ctx, lambda bq_client, bucket_filepaths: bucket_files_to_bq(bq_client, bucket_filepaths, 'project', 'dataset', 'table', 't'))
+
+def bench_bin_file_to_bucket(ctx:Bench_Context):
+	storage_client = Fake_Storage_Client(ctx.latency)
+	csv_files = bigquery.df_to_csv_bin(ctx.df, ctx.slice_row, 'bench.csv')
+	def run():
+		bin_file_to_bucket(storage_client, 'bench_bucket', 'bench', csv_files, mode='t', workers=ctx.workers)
+		return _buffer_bytes(csv_files)
+	return run
+
+def bench_bq_to_bucket(ctx:Bench_Context):
+	bq_client = Fake_BQ_Client(ctx.df, ctx.latency, ctx.args.exec_seconds)
+	storage_client = Fake_Storage_Client(ctx.latency)
+	def run():
+		bq_to_bucket(bq_client, storage_client, ctx.sql_script, ctx.slice_row, 'bench_bucket', 'bench', 'bench.csv', workers=ctx.workers)
+		return sum(len(data) for data in storage_client.bucket('bench_bucket').objects.values())
+	return run
+
+def bench_local_file_to_drive(ctx:Bench_Context):
+	google_drive = Google_Drive(Fake_Drive_Service(ctx.latency), is_shared_drive=False)
+	file_path = ctx.local_csv()
+	def run():
+		google_drive.local_file_to_drive('root', file_path, update_dup=True, index_ttl=0)
+		return os.path.getsize(file_path)
+	return run
+
+def bench_bin_file_to_drive(ctx:Bench_Context):
+	google_drive = Google_Drive(Fake_Drive_Service(ctx.latency), is_shared_drive=False)
+	csv_files = bigquery.df_to_csv_bin(ctx.df, ctx.slice_row, 'bench.csv')
+	def run():
+		google_drive.bin_file_to_drive('root', csv_files, update_dup=True)
+		return _buffer_bytes(csv_files)
+	return run
+
+def bench_drive_upload_batch(ctx:Bench_Context):
+	drive_service = Fake_Drive_Service(ctx.latency)
+	google_drive = Google_Drive(drive_service, is_shared_drive=False)
+	google_drive.service_factory = lambda: drive_service
+	csv_files = bigquery.df_to_csv_bin(ctx.df, ctx.slice_row, 'bench.csv')
+	def run():
+		google_drive.drive_upload_batch('root', csv_files, update_dup=True, workers=ctx.workers, rate_limiter=Rate_Limiter(rate=1000, max_rate=1000))
+		return _buffer_bytes(csv_files)
+	return run
+
+CASES = {
+	'bq_to_df': bench_bq_to_df,
+	'bq_to_df_iter': bench_bq_to_df_iter,
+	'df_to_bq': bench_df_to_bq,
+	'df_to_csv': bench_df_to_csv,
+	'df_to_csv[arrow]': bench_df_to_csv_arrow,
+	'df_to_excel': bench_df_to_excel,
+	'df_to_csv_bin': bench_df_to_csv_bin,
+	'df_to_excel_bin': bench_df_to_excel_bin,
+	'df_to_csv_bin_iter': bench_df_to_csv_bin_iter,
+	'df_to_parquet_bin': bench_df_to_parquet_bin,
+	'df_to_avro_bin': bench_df_to_avro_bin,
+	'bq_to_csv': bench_bq_to_csv,
+	'bq_to_csv[stream]': bench_bq_to_csv_stream,
+	'bq_to_csv[lazy]': bench_bq_to_csv_lazy,
+	'file_to_bucket': bench_file_to_bucket,
+	'file_to_bucket[composite]': bench_file_to_bucket_composite,
+	'file_to_bucket[sync]': bench_file_to_bucket_sync,
+	'bin_file_to_bucket': bench_bin_file_to_bucket,
+	'bq_to_bucket': bench_bq_to_bucket,
+	'bucket_file_to_bq': bench_bucket_file_to_bq,
+	'bucket_files_to_bq': bench_bucket_files_to_bq,
+	'local_file_to_drive': bench_local_file_to_drive,
+	'bin_file_to_drive': bench_bin_file_to_drive,
+	'drive_upload_batch': bench_drive_upload_batch,
+}
+
+# ==========
+# = Runner =
+# ==========
+
+def _call_stats(calls:list) -> dict:
+	by_call = {}
+	for call, seconds, nbytes in calls:
+		by_call.setdefault(call, []).append(seconds)
+
+	stats = {}
+	for call, durations in sorted(by_call.items()):
+		durations.sort()
+		stats[call] = {
+			'count': len(durations),
+			'mean_seconds': statistics.fmean(durations),
+			'p95_seconds': durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+			'total_seconds': sum(durations),
+		}
+	return stats
+
+# time a case repeat times, then run it once more under tracemalloc for peak memory
+# tracemalloc sees numpy and Python allocations but not Arrow's memory pool, which is reported separately
+def run_case(name:str, case, ctx:Bench_Context, repeat:int, measure_memory:bool=True) -> dict:
+	timings = []
+	total_bytes = 0
+	for _ in range(repeat):
+		run = case(ctx)
+		ctx.latency.reset()
+		start = time.perf_counter()
+		total_bytes = run()
+		timings.append(time.perf_counter() - start)
+	calls = list(ctx.latency.calls)
+
+	peak_memory = None
+	arrow_held = None
+	if measure_memory:
+		run = case(ctx)
+		arrow_start = pa.total_allocated_bytes()
+		tracemalloc.start()
+		try:
+			run()
+			_, peak_memory = tracemalloc.get_traced_memory()
+		finally:
+			tracemalloc.stop()
+		arrow_held = pa.total_allocated_bytes() - arrow_start
+
+	best_seconds = min(timings)
+	return {
+		'name': name,
+		'rows': len(ctx.df),
+		'bytes': total_bytes,
+		'seconds': timings,
+		'best_seconds': best_seconds,
+		'median_seconds': statistics.median(timings),
+		'rows_per_second': len(ctx.df) / best_seconds if best_seconds else None,
+		'mb_per_second': total_bytes / 1024**2 / best_seconds if best_seconds else None,
+		'peak_memory_bytes': peak_memory,
+		'arrow_bytes_held': arrow_held,
+		'fake_calls': _call_stats(calls),
+	}
+
+def _git_commit() -> str:
+	try:
+		return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+	except Exception:
+		return None
+
+def _environment() -> dict:
+	return {
+		'timestamp': datetime.now().isoformat(),
+		'git_commit': _git_commit(),
+		'python': sys.version.split()[0],
+		'platform': platform.platform(),
+		'cpu_count': os.cpu_count(),
+		'pandas': pd.__version__,
+		'numpy': np.__version__,
+		'pyarrow': pa.__version__,
+	}
+
+def _print_results(results:list, baseline:dict=None):
+	print(f"\n{'case':<28}{'best s':>10}{'rows/s':>14}{'MB/s':>10}{'peak MB':>10}{'vs base':>10}")
+	for result in results:
+		peak = f"{result['peak_memory_bytes'] / 1024**2:.1f}" if result['peak_memory_bytes'] is not None else '-'
+		ratio = '-'
+		if baseline and result['name'] in baseline:
+			ratio = f"{baseline[result['name']]['best_seconds'] / result['best_seconds']:.2f}x"
+		print(f"{result['name']:<28}{result['best_seconds']:>10.3f}{result['rows_per_second']:>14,.0f}{result['mb_per_second']:>10.1f}{peak:>10}{ratio:>10}")
+
+def parse_args(argv=None):
+	parser = argparse.ArgumentParser(description='Offline benchmarks for python_utils export and upload functions.')
+	parser.add_argument('--rows', type=int, default=50000, help='rows in the synthetic DataFrame')
+	parser.add_argument('--cols', type=int, default=10, help='columns in the synthetic DataFrame')
+	parser.add_argument('--slice-row', type=int, default=10000, help='slice_row passed to the export functions')
+	parser.add_argument('--workers', type=int, default=1, help='workers passed to the functions that take it')
+	parser.add_argument('--repeat', type=int, default=3, help='timed runs per case')
+	parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every fake client call')
+	parser.add_argument('--jitter', type=float, default=0.0, help='random extra seconds (0 to jitter) per fake client call')
+	parser.add_argument('--bandwidth', type=float, default=None, help='simulated transfer speed in MB/s (default: unlimited)')
+	parser.add_argument('--exec-seconds', type=float, default=0.0, help='simulated BigQuery execution time per query')
+	parser.add_argument('--cases', default=None, help=f'comma-separated case names or substrings. Available: {", ".join(CASES)}')
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc peak memory run')
+	parser.add_argument('--output', default=None, help='write the results to this JSON file')
+	parser.add_argument('--compare', default=None, help='a previous JSON result to compare against')
+	return parser.parse_args(argv)
+
+def main(argv=None) -> dict:
+	args = parse_args(argv)
+
+	selected = CASES
+	if args.cases:
+		filters = [name.strip() for name in args.cases.split(',') if name.strip()]
+		selected = {name: case for name, case in CASES.items() if any(name_filter in name for name_filter in filters)}
+		if not selected:
+			raise ValueError(f'No benchmark matches {args.cases}. Available: {list(CASES)}')
+
+	ctx = Bench_Context(args)
+	results = []
+	try:
+		for name, case in selected.items():
+			print(f'{datetime.now()} running {name}')
+			results.append(run_case(name, case, ctx, args.repeat, not args.no_memory))
+	finally:
+		ctx.close()
+
+	report = {
+		'environment': _environment(),
+		'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+		'results': results,
+	}
+
+	baseline = None
+	if args.compare:
+		with open(args.compare) as baseline_file:
+			baseline = {result['name']: result for result in json.load(baseline_file)['results']}
+	_print_results(results, baseline)
+
+	if args.output:
+		with open(args.output, 'w') as output_file:
+			json.dump(report, output_file, indent=2)
+		print(f'\nResults saved to {args.output}')
+
+	return report
+
+if __name__ == '__main__':
+	main()
@@ -1,4 +1,4 @@
-pip install --upgrade dask pandas pandas-gbq numpy openpyxl xlsxwriter xlrd db-dtypes SQLAlchemy
+pip install --upgrade dask pandas pandas-gbq numpy openpyxl xlsxwriter xlrd db-dtypes SQLAlchemy pyarrow
 pip install --upgrade google-api-python-client pydrive
 pip install --upgrade google-cloud-bigquery google-cloud-storage google-cloud-bigquery-storage
 pip install --upgrade google-cloud-secret-manager google-auth google-auth-oauthlib google-auth-httplib2
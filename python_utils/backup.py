@@ -2,6 +2,7 @@ import pandas as pd
 from io import BytesIO
 from datetime import datetime
 from google.cloud import bigquery as bq
+from python_utils.bigquery import bq_to_df, bq_to_df_iter, df_to_csv_bin_iter, _encode_csv, _iter_slices
 
 def bq_to_csv(bq_client,
 			  sql_script:str,
@@ -13,13 +14,25 @@ def bq_to_csv(bq_client,
 			  index:bool=False,
 			  header:bool=True,
 			  log:bool=False,
-			  ignore_error:bool=False
+			  ignore_error:bool=False,
+			  stream:bool=False,
+			  lazy:bool=False,
+			  encoder:str='pandas'
 ) -> tuple:
 
 	if not 0 < slice_row <= 1000000:
 		raise ValueError('Invalid slice length.')
 
-	results_df = bq_to_df(bq_client, sql_script, replace_in_query, log, ignore_error)
+	# stream mode fetches the results page by page instead of building the full DF
+	if stream:
+		results_df = bq_to_df_iter(bq_client, sql_script, slice_row, replace_in_query, log, ignore_error)
+	else:
+		results_df = bq_to_df(bq_client, sql_script, replace_in_query, log, ignore_error)
+
+	# lazy mode returns a generator that encodes one buffer at a time
+	if lazy:
+		return df_to_csv_bin_iter(results_df, slice_row, outfile_name, sep, log, ignore_error, encoding=encoding, index=index, header=header, encoder=encoder)
+
 	csv_buffers = []
 
 	if slice_row == 0:
@@ -47,23 +60,15 @@ def bq_to_csv(bq_client,
 				raise
 
 	else:
-		for cur_row in range(0, len(results_df), slice_row):
+		for file_ver, subset_df in _iter_slices(results_df, slice_row):
 			try:
-				file_ver = cur_row // slice_row + 1
-				subset_df = results_df.iloc[cur_row:cur_row + slice_row]
 				new_outfile_name = outfile_name.replace('.csv', f'_{file_ver}.csv')
 
 				if log:
 					print(f'{datetime.now()} creating CSV binary file for {new_outfile_name}')
 
 				cur_buffer = BytesIO()
-				subset_df.to_csv(
-					path_or_buf=cur_buffer, 
-					sep=sep,
-					encoding=encoding,
-					index=index, 
-					header=header
-				)
+				_encode_csv(subset_df, cur_buffer, sep, encoding, index, header, encoder)
 				cur_buffer.seek(0)
 				csv_buffers.append((new_outfile_name, cur_buffer))
 
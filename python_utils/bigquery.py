@@ -1,16 +1,40 @@
 import os
+import re
+import gzip
+import time
+import json
+import hashlib
+import threading
+import xlsxwriter
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from pyarrow import csv as pa_csv
 from io import BytesIO
-from datetime import datetime
+from tempfile import SpooledTemporaryFile
+from collections import deque
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from decimal import Decimal
+from datetime import date, datetime, timedelta
 from google.cloud import bigquery as bq
-from typing import List, Tuple
+from typing import Dict, Iterable, Iterator, List, Tuple
+from python_utils.utils import _run_slices, _timed_call
+
+# optional: only needed for Avro export
+try:
+	import fastavro
+except ImportError:
+	fastavro = None
 
 # ===============
 # = local to BQ = 
 # ===============
 
 # load Pandas Dataframe data to BigQuery
-def df_to_bq(bq_client, df:pd.DataFrame, table_id:str, mode:str, schema=None, autodetect:bool=True):
+# chunk_row splits the load into compressed Parquet chunks that are serialized and committed one at a time
+def df_to_bq(bq_client, df:pd.DataFrame, table_id:str, mode:str, schema=None, autodetect:bool=True, chunk_row:int=None, compression:str='snappy', start_chunk:int=1, workers:int=1, log:bool=False, skip_chunks:Iterable[int]=()):
 	if mode == 'a':
 		write_disposition = 'WRITE_APPEND'
 	elif mode == 't':
@@ -18,6 +42,9 @@ def df_to_bq(bq_client, df:pd.DataFrame, table_id:str, mode:str, schema=None, au
 	else:
 		raise ValueError(f"{mode} is not recognised. Use 'a' for append or 't' for truncate")
 
+	if chunk_row:
+		return _df_to_bq_chunks(bq_client, df, table_id, write_disposition, schema, autodetect, chunk_row, compression, start_chunk, workers, log, skip_chunks)
+
 	try:
 		job_config = bq.LoadJobConfig(schema=schema, write_disposition=write_disposition, autodetect=autodetect)
 		job = bq_client.load_table_from_dataframe(df, table_id, job_config=job_config)
@@ -26,35 +53,876 @@ def df_to_bq(bq_client, df:pd.DataFrame, table_id:str, mode:str, schema=None, au
 	except Exception:
 		raise
 
+# load DF chunks as Parquet files, one load job per chunk
+# the first chunk applies write_disposition, the rest are appended (concurrently if workers > 1)
+# a failed load can be resumed with start_chunk = the first failed chunk number; with workers > 1, later chunks
+# that were in flight may have been committed too, and are passed back as skip_chunks
+def _df_to_bq_chunks(bq_client, df, table_id:str, write_disposition:str, schema, autodetect:bool, chunk_row:int, compression:str, start_chunk:int, workers:int, log:bool, skip_chunks:Iterable[int]=()) -> list:
+	if chunk_row < 1:
+		raise ValueError('Invalid chunk length.')
+	if start_chunk < 1:
+		raise ValueError('start_chunk must be at least 1')
+	skip_chunks = set(skip_chunks)
+
+	# resumed loads never truncate the chunks that are already in the table
+	if start_chunk > 1 or skip_chunks:
+		write_disposition = 'WRITE_APPEND'
+
+	def job_config(disposition:str):
+		return bq.LoadJobConfig(
+			schema=schema,
+			write_disposition=disposition,
+			autodetect=autodetect,
+			source_format=bq.SourceFormat.PARQUET
+		)
+
+	chunks = (
+		(chunk_num, subset_df)
+		for chunk_num, subset_df in _iter_slices(df, chunk_row)
+		if chunk_num >= start_chunk and chunk_num not in skip_chunks
+	)
+	first_chunk = next(chunks, None)
+	if first_chunk is None:
+		return []
+
+	# the first chunk creates or truncates the table on its own before any append runs
+	stages = [([first_chunk], write_disposition, 1), (chunks, 'WRITE_APPEND', workers)]
+	jobs = []
+	loaded = set()
+	failed = []	# (chunk number, error)
+
+	# no new chunk is submitted after a failure, but the chunks already in flight are waited for and recorded
+	def stage_tasks(stage_chunks, disposition:str):
+		for chunk_num, subset_df in stage_chunks:
+			if failed:
+				return
+			yield chunk_num, (bq_client, subset_df, table_id, job_config(disposition), compression)
+
+	for stage_chunks, disposition, stage_workers in stages:
+		for chunk_num, job, error, elapsed in _run_slices(_load_parquet_chunk, stage_tasks(stage_chunks, disposition), stage_workers):
+			if error:
+				failed.append((chunk_num, error))
+				continue
+
+			jobs.append(job)
+			loaded.add(chunk_num)
+			if log:
+				print(f'{datetime.now()} loaded chunk {chunk_num} ({job.output_rows} rows) to {table_id} ({elapsed:.2f}s)')
+
+	if failed:
+		resume_chunk, error = min(failed, key=lambda failure: failure[0])
+		loaded_after = sorted(skip_chunks | {chunk_num for chunk_num in loaded if chunk_num > resume_chunk})
+		resume_args = f'start_chunk={resume_chunk}, skip_chunks={loaded_after}' if loaded_after else f'start_chunk={resume_chunk}'
+		print(f'Failed to load chunk(s) {sorted(chunk_num for chunk_num, _ in failed)} to {table_id}. Resume with {resume_args}.\n{error}')
+		raise error
+
+	return jobs
+
+# serialize a DF chunk to compressed Parquet and load it in one job
+def _load_parquet_chunk(bq_client, subset_df:pd.DataFrame, table_id:str, job_config, compression:str):
+	cur_buffer = _encode_parquet_buffer(subset_df, compression)
+	job = bq_client.load_table_from_file(cur_buffer, table_id, job_config=job_config)
+	job.result()
+	return job
+
+# =================
+# = SQL templates = 
+# =================
+
+# SQL script read once and rendered with all search and replace pairs in a single pass
+class Sql_Template:
+	def __init__(self, query:str):
+		self.query = query
+
+	# apply every (find, replace) pair in one scan of the query
+	# replaced text is never searched again, so the result doesn't depend on the order of the pairs
+	# matches are taken left to right; at one position the longest search string wins, e.g. '.table01' before '.table'
+	# an earlier match always wins over a later, longer one that overlaps it
+	def render(self, replace_in_query:list=[]) -> str:
+		replacements = _replacement_map(replace_in_query)
+		if not replacements:
+			return self.query
+
+		pattern = _compile_finds(tuple(replacements))
+		return pattern.sub(lambda match: replacements[match.group(0)], self.query)
+
+	# return the search strings that don't appear in the query
+	def validate(self, replace_in_query:list=[]) -> list:
+		return [find for find in _replacement_map(replace_in_query) if find not in self.query]
+
+# compiled templates keyed by script path, reloaded when the file's mtime or size changes
+_sql_templates = {}
+_sql_templates_lock = threading.Lock()
+
+# return the compiled template for a SQL script
+def load_sql_template(sql_script:str) -> Sql_Template:
+	stat = os.stat(sql_script)
+	version = (stat.st_mtime_ns, stat.st_size)
+
+	with _sql_templates_lock:
+		cached = _sql_templates.get(sql_script)
+	if cached and cached[0] == version:
+		return cached[1]
+
+	with open(sql_script, 'r') as cur_script:
+		template = Sql_Template(' '.join([line for line in cur_script]))
+
+	with _sql_templates_lock:
+		_sql_templates[sql_script] = (version, template)
+	return template
+
+# read SQL script and apply search and replace pairs
+def render_query(sql_script:str, replace_in_query:list=[]) -> str:
+	return load_sql_template(sql_script).render(replace_in_query)
+
+# check a SQL script for search strings that don't appear in it
+def validate_query(sql_script:str, replace_in_query:list=[]) -> list:
+	return load_sql_template(sql_script).validate(replace_in_query)
+
+# first occurrence of a search string wins, same as chained str.replace
+def _replacement_map(replace_in_query:list) -> dict:
+	replacements = {}
+	for find, replace in replace_in_query:
+		if not find:
+			raise ValueError('Search strings in replace_in_query cannot be empty.')
+		replacements.setdefault(find, replace)
+	return replacements
+
+# one alternation regex per set of search strings, longest first so ties at the same position go to the longest
+@lru_cache(maxsize=256)
+def _compile_finds(finds:tuple):
+	return re.compile('|'.join(re.escape(find) for find in sorted(finds, key=len, reverse=True)))
+
 # ===============
 # = BQ to local = 
 # ===============
 
+# local on-disk cache of query results, keyed by a hash of the fully rendered query
+# entries expire after ttl seconds; least recently used entries are evicted once the cache exceeds max_bytes
+# file mtime records when an entry was written and atime records when it was last read
+class Query_Cache:
+	def __init__(self, cache_dir:str, ttl:int=3600, max_bytes:int=1024**3, file_format:str='parquet'):
+		if file_format not in ('parquet', 'arrow'):
+			raise ValueError("Invalid file format. Use 'parquet' or 'arrow' (Arrow IPC).")
+		if ttl is not None and ttl <= 0:
+			raise ValueError('ttl must be greater than 0 or None (no expiry)')
+
+		self.cache_dir = cache_dir
+		self.ttl = ttl
+		self.max_bytes = max_bytes
+		self.file_format = file_format
+		self.file_ext = '.parquet' if file_format == 'parquet' else '.arrow'
+		os.makedirs(cache_dir, exist_ok=True)
+
+	def key(self, query:str) -> str:
+		return hashlib.sha256(query.encode('utf-8')).hexdigest()
+
+	def path(self, query:str) -> str:
+		return os.path.join(self.cache_dir, f'{self.key(query)}{self.file_ext}')
+
+	# return cached results for the query, or None on a miss or an expired entry
+	# an entry that can't be read (truncated, corrupt, no permission) is removed and treated as a miss
+	def get(self, query:str, log:bool=False):
+		cache_path = self.path(query)
+		try:
+			stat = os.stat(cache_path)
+			if self._is_expired(stat):
+				self._remove(cache_path)
+				return None
+
+			if self.file_format == 'parquet':
+				results_df = pd.read_parquet(cache_path)
+			else:
+				results_df = pd.read_feather(cache_path)
+
+			# mark the entry as recently used, keep the write time for ttl
+			os.utime(cache_path, (time.time(), stat.st_mtime))
+		except FileNotFoundError:
+			return None
+		except Exception as error:
+			if log:
+				print(f'Unable to read cache entry {cache_path}, querying instead\n{error}')
+			try:
+				self._remove(cache_path)
+			except OSError:
+				pass
+			return None
+
+		return results_df
+
+	def put(self, query:str, results_df:pd.DataFrame):
+		cache_path = self.path(query)
+		tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+
+		# write to a temp file first so readers never see a partial entry
+		try:
+			if self.file_format == 'parquet':
+				results_df.to_parquet(tmp_path, index=False)
+			else:
+				results_df.reset_index(drop=True).to_feather(tmp_path)
+			os.replace(tmp_path, cache_path)
+		finally:
+			self._remove(tmp_path)
+
+		self.evict()
+
+	# drop the entry for one query, or every entry if query is None
+	def invalidate(self, query:str=None):
+		if query is not None:
+			self._remove(self.path(query))
+			return
+
+		for cache_path, _ in self._entries():
+			self._remove(cache_path)
+
+	# drop expired entries, then least recently used entries until the cache fits in max_bytes
+	def evict(self):
+		entries = []
+		for cache_path, stat in self._entries():
+			if self._is_expired(stat):
+				self._remove(cache_path)
+			else:
+				entries.append((stat.st_atime, stat.st_size, cache_path))
+
+		total_bytes = sum(size for _, size, _ in entries)
+		for _, size, cache_path in sorted(entries):
+			if self.max_bytes is None or total_bytes <= self.max_bytes:
+				break
+			self._remove(cache_path)
+			total_bytes -= size
+
+	def _entries(self):
+		for file_name in os.listdir(self.cache_dir):
+			if not file_name.endswith(self.file_ext):
+				continue
+			cache_path = os.path.join(self.cache_dir, file_name)
+			try:
+				yield cache_path, os.stat(cache_path)
+			except FileNotFoundError:
+				continue
+
+	def _is_expired(self, stat) -> bool:
+		return self.ttl is not None and time.time() - stat.st_mtime > self.ttl
+
+	def _remove(self, cache_path:str):
+		try:
+			os.remove(cache_path)
+		except FileNotFoundError:
+			pass
+
+# timings and job statistics for one query
+# queue_seconds: job created -> started, exec_seconds: started -> ended, download_seconds: rows fetched into the DF
+# local_cache is True when the results came from a Query_Cache, in which case there are no job statistics
+class Query_Metrics:
+	def __init__(self,
+				 sql_script:str,
+				 job_id:str=None,
+				 queue_seconds:float=None,
+				 exec_seconds:float=None,
+				 download_seconds:float=None,
+				 total_bytes_processed:int=None,
+				 total_bytes_billed:int=None,
+				 slot_millis:int=None,
+				 cache_hit:bool=None,
+				 local_cache:bool=False,
+				 rows:int=0
+	):
+		self.sql_script = sql_script
+		self.job_id = job_id
+		self.queue_seconds = queue_seconds
+		self.exec_seconds = exec_seconds
+		self.download_seconds = download_seconds
+		self.total_bytes_processed = total_bytes_processed
+		self.total_bytes_billed = total_bytes_billed
+		self.slot_millis = slot_millis
+		self.cache_hit = cache_hit
+		self.local_cache = local_cache
+		self.rows = rows
+		self.rows_per_second = rows / download_seconds if download_seconds else None
+
+	def as_dict(self) -> dict:
+		return dict(self.__dict__)
+
+	def __repr__(self) -> str:
+		return f'Query_Metrics({self.as_dict()})'
+
+# a metrics sink that keeps every Query_Metrics it receives and optionally appends them to a JSON lines file
+class Metrics_Log:
+	def __init__(self, path:str=None):
+		self.path = path
+		self.records = []
+		self._lock = threading.Lock()
+
+	def __call__(self, metrics:Query_Metrics):
+		with self._lock:
+			self.records.append(metrics)
+			if self.path:
+				with open(self.path, 'a') as log_file:
+					log_file.write(json.dumps({'logged_at': datetime.now().isoformat(), **metrics.as_dict()}) + '\n')
+
+	# the n slowest queries by any numeric Query_Metrics field, e.g. exec_seconds or total_bytes_billed
+	def slowest(self, n:int=10, by:str='exec_seconds') -> List[Query_Metrics]:
+		records = [metrics for metrics in self.records if getattr(metrics, by) is not None]
+		return sorted(records, key=lambda metrics: getattr(metrics, by), reverse=True)[:n]
+
+def _job_metrics(sql_script:str, job, download_seconds:float, rows:int) -> Query_Metrics:
+	def seconds_between(start, end):
+		if start is None or end is None:
+			return None
+		return (end - start).total_seconds()
+
+	return Query_Metrics(
+		sql_script,
+		job_id=job.job_id,
+		queue_seconds=seconds_between(job.created, job.started),
+		exec_seconds=seconds_between(job.started, job.ended),
+		download_seconds=download_seconds,
+		total_bytes_processed=job.total_bytes_processed,
+		total_bytes_billed=job.total_bytes_billed,
+		slot_millis=job.slot_millis,
+		cache_hit=job.cache_hit,
+		rows=rows
+	)
+
+# a failing sink should not fail the query
+def _report_metrics(metrics_sink, metrics:Query_Metrics, log=False):
+	if metrics_sink is None:
+		return
+	try:
+		metrics_sink(metrics)
+	except Exception as error:
+		if log:
+			print(f'Unable to record metrics for {metrics.sql_script}\n{error}')
+
+# estimate the bytes a query would scan without running it
+# dry runs are not billed and return as soon as the query is validated
+def bq_dry_run(bq_client, sql_script:str, replace_in_query:list=[], log=False) -> int:
+	total_bytes = _dry_run_bytes(bq_client, render_query(sql_script, replace_in_query))
+	if log:
+		print(f'{datetime.now()} {sql_script} would process {total_bytes:,} bytes ({total_bytes / 1024**3:.2f} GiB)')
+	return total_bytes
+
+def _dry_run_bytes(bq_client, query:str) -> int:
+	job_config = bq.QueryJobConfig(dry_run=True, use_query_cache=False)
+	return bq_client.query(query, job_config=job_config).total_bytes_processed or 0
+
 # extract BQ query data to Pandas DF
-def bq_to_df(bq_client, sql_script:str, replace_in_query:list=[], log=False, ignore_error=False) -> pd.DataFrame:
-	with open(sql_script, 'r') as cur_script:
+# pass a Query_Cache to reuse results of identical rendered queries from local disk
+# metrics_sink is called with the Query_Metrics of the query, e.g. a Metrics_Log; return_metrics returns (DF, Query_Metrics)
+# max_bytes dry-runs the query first and refuses to run it if it would process more bytes than that
+def bq_to_df(bq_client,
+			 sql_script:str,
+			 replace_in_query:list=[],
+			 log=False,
+			 ignore_error=False,
+			 cache:Query_Cache=None,
+			 metrics_sink=None,
+			 return_metrics:bool=False,
+			 max_bytes:int=None
+) -> pd.DataFrame:
+	if log:
+		print(f'\n\n{datetime.now()} Query: {sql_script}')
+
+	query = render_query(sql_script, replace_in_query)
+
+	if cache is not None:
+		start = time.perf_counter()
+		results_df = cache.get(query, log)
+		if results_df is not None:
+			if log:
+				print(f'Results (cached): {results_df.shape}')
+			metrics = Query_Metrics(sql_script, download_seconds=time.perf_counter() - start, local_cache=True, rows=len(results_df))
+			_report_metrics(metrics_sink, metrics, log)
+			return (results_df, metrics) if return_metrics else results_df
+
+	try:
+		if max_bytes is not None:
+			total_bytes = _dry_run_bytes(bq_client, query)
+			if total_bytes > max_bytes:
+				raise ValueError(f'{sql_script} would process {total_bytes:,} bytes, above max_bytes ({max_bytes:,}).')
+
+		query_job = bq_client.query(query)
+		query_job.result()
+
+		start = time.perf_counter()
+		results_df = query_job.to_dataframe()
+		download_seconds = time.perf_counter() - start
+	except Exception:
+		print(f'{sql_script} query failed.')
+		if ignore_error:
+			results_df = pd.DataFrame() 
+			return (results_df, None) if return_metrics else results_df
+		raise
+
+	metrics = _job_metrics(sql_script, query_job, download_seconds, len(results_df))
+
+	if log:
+		print(f'Results: {results_df.shape}')
+		print(f'Exec: {metrics.exec_seconds}s, download: {download_seconds:.2f}s, billed: {metrics.total_bytes_billed} bytes, cache hit: {metrics.cache_hit}')
+
+	_report_metrics(metrics_sink, metrics, log)
+
+	if cache is not None:
+		_cache_results(cache, query, results_df, sql_script, log)
+
+	return (results_df, metrics) if return_metrics else results_df
+
+# a failed cache write should not fail the query
+def _cache_results(cache:Query_Cache, query:str, results_df:pd.DataFrame, sql_script:str, log=False):
+	try:
+		cache.put(query, results_df)
+	except Exception as error:
 		if log:
-			print(f'\n\n{datetime.now()} Query: {sql_script}')
+			print(f'Unable to cache results for {sql_script}\n{error}')
+
+# run many SQL scripts concurrently and return the results keyed by script path
+# queries: list of (sql_script, replace_in_query) or (sql_script, replace_in_query, ignore_error)
+# or a dict of {key: (sql_script, replace_in_query[, ignore_error])} to run one script with different replacements
+# up to max_in_flight query jobs run at once and each result is downloaded as soon as its job finishes
+# metrics_sink is called with the Query_Metrics of every query, as in bq_to_df
+def bq_to_df_batch(bq_client, queries, max_in_flight:int=8, poll_interval:float=1.0, log=False, ignore_error=False, cache:Query_Cache=None, metrics_sink=None) -> Dict[str, pd.DataFrame]:
+	if max_in_flight < 1:
+		raise ValueError('max_in_flight must be at least 1')
+
+	if isinstance(queries, dict):
+		entries = [(key, *entry) for key, entry in queries.items()]
+	else:
+		entries = [(entry[0], *entry) for entry in queries]
+		scripts = [entry[0] for entry in entries]
+		if len(set(scripts)) != len(scripts):
+			raise ValueError('Duplicate SQL scripts in queries. Pass a dict of {key: (sql_script, replace_in_query)} instead.')
+
+	results = {}
+	pending = deque(entries)
+	running = {}	# key -> (sql_script, query, query job, ignore_error)
+	downloads = {}	# download future -> (key, sql_script, query, query job, ignore_error)
 
+	def query_failed(key, sql_script, entry_ignore_error, error):
+		print(f'{sql_script} query failed.\n{error}')
+		if not entry_ignore_error:
+			for _, _, job, _ in running.values():
+				job.cancel()
+			raise error
+		results[key] = pd.DataFrame()
+
+	with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+		while pending or running or downloads:
+			# submit query jobs up to the in-flight limit
+			while pending and len(running) + len(downloads) < max_in_flight:
+				key, sql_script, replace_in_query, *entry_ignore_error = pending.popleft()
+				entry_ignore_error = entry_ignore_error[0] if entry_ignore_error else ignore_error
+				query = render_query(sql_script, replace_in_query)
+
+				start = time.perf_counter()
+				cached_df = cache.get(query, log) if cache is not None else None
+				if cached_df is not None:
+					if log:
+						print(f'{datetime.now()} {key} results (cached): {cached_df.shape}')
+					metrics = Query_Metrics(sql_script, download_seconds=time.perf_counter() - start, local_cache=True, rows=len(cached_df))
+					_report_metrics(metrics_sink, metrics, log)
+					results[key] = cached_df
+					continue
+
+				try:
+					running[key] = (sql_script, query, bq_client.query(query), entry_ignore_error)
+				except Exception as error:
+					query_failed(key, sql_script, entry_ignore_error, error)
+					continue
+
+				if log:
+					print(f'{datetime.now()} submitted {key}')
+
+			# hand finished jobs over to the download pool
+			for key, (sql_script, query, job, entry_ignore_error) in list(running.items()):
+				try:
+					if not job.done():
+						continue
+				except Exception as error:
+					del running[key]
+					query_failed(key, sql_script, entry_ignore_error, error)
+					continue
+
+				del running[key]
+				downloads[pool.submit(_timed_call, job.to_dataframe)] = (key, sql_script, query, job, entry_ignore_error)
+
+			if not downloads:
+				if running:
+					time.sleep(poll_interval)
+				continue
+
+			# wait for a download to finish, or poll the running jobs again
+			done, _ = wait(downloads, timeout=poll_interval if running else None, return_when=FIRST_COMPLETED)
+			for future in done:
+				key, sql_script, query, job, entry_ignore_error = downloads.pop(future)
+				try:
+					results_df, download_seconds = future.result()
+				except Exception as error:
+					query_failed(key, sql_script, entry_ignore_error, error)
+					continue
+
+				if log:
+					print(f'{datetime.now()} {key} results: {results_df.shape}')
+				_report_metrics(metrics_sink, _job_metrics(sql_script, job, download_seconds, len(results_df)), log)
+				if cache is not None:
+					_cache_results(cache, query, results_df, sql_script, log)
+				results[key] = results_df
+
+	# keep the order the queries were given in
+	return {entry[0]: results[entry[0]] for entry in entries}
+
+# stream BQ query data as Pandas DF chunks of slice_row rows
+# result pages are fetched one at a time, so peak memory is bounded by slice_row instead of the result size
+def bq_to_df_iter(bq_client, sql_script:str, slice_row:int, replace_in_query:list=[], log=False, ignore_error=False) -> Iterator[pd.DataFrame]:
+	if not 0 < slice_row <= 1000000:
+		raise ValueError('Invalid slice length.')
+
+	if log:
+		print(f'\n\n{datetime.now()} Query: {sql_script}')
+
+	query = render_query(sql_script, replace_in_query)
+	total_rows = 0
+	try:
+		rows = bq_client.query(query).result(page_size=slice_row)
+		for chunk_df in _rechunk_frames(rows.to_dataframe_iterable(), slice_row):
+			total_rows += len(chunk_df)
+			yield chunk_df
+	except Exception:
+		print(f'{sql_script} query failed.')
+		if ignore_error:
+			return
+		raise
+
+	if log:
+		print(f'Results: {total_rows} rows')
+
+# regroup DF chunks of any size into chunks of exactly slice_row rows (the last chunk may be shorter)
+def _rechunk_frames(frames, slice_row:int) -> Iterator[pd.DataFrame]:
+	pending = []
+	pending_rows = 0
+
+	for frame in frames:
+		if frame.empty:
+			continue
+		pending.append(frame)
+		pending_rows += len(frame)
+		if pending_rows < slice_row:
+			continue
+
+		merged_df = pd.concat(pending, ignore_index=True) if len(pending) > 1 else pending[0]
+		cur_row = 0
+		while pending_rows - cur_row >= slice_row:
+			yield merged_df.iloc[cur_row:cur_row + slice_row]
+			cur_row += slice_row
+
+		# keep the leftover rows for the next chunk
+		pending = [merged_df.iloc[cur_row:]] if cur_row < pending_rows else []
+		pending_rows -= cur_row
+
+	if pending:
+		yield pd.concat(pending, ignore_index=True) if len(pending) > 1 else pending[0]
+
+# yield (file version, DF slice) pairs
+# df can be a DataFrame or an iterable of DF chunks, e.g. from bq_to_df_iter
+def _iter_slices(df, slice_row:int):
+	if isinstance(df, pd.DataFrame):
+		for cur_row in range(0, len(df), slice_row):
+			yield cur_row // slice_row + 1, df.iloc[cur_row:cur_row + slice_row]
+	else:
+		yield from enumerate(_rechunk_frames(df, slice_row), start=1)
+
+# yield (sliced file name, DF slice) pairs, e.g. sales.csv -> sales_1.csv, sales_2.csv...
+def _named_slices(df, slice_row:int, outfile_name:str, file_ext:str):
+	for file_ver, subset_df in _iter_slices(df, slice_row):
+		yield outfile_name.replace(file_ext, f'_{file_ver}{file_ext}'), subset_df
+
+# ================
+# = CSV encoders =
+# ================
+
+CSV_ENCODERS = ('pandas', 'arrow')
+
+# write a DF slice as CSV to a binary file handle
+# the arrow encoder produces the same bytes as DataFrame.to_csv and falls back to pandas for slices it can't match
+def _encode_csv(subset_df:pd.DataFrame, target, sep:str=',', encoding:str='utf-8', index:bool=False, header:bool=True, encoder:str='pandas'):
+	if encoder not in CSV_ENCODERS:
+		raise ValueError(f'Invalid CSV encoder. Supported: {list(CSV_ENCODERS)}')
+
+	if encoder == 'arrow' and not index and encoding.lower().replace('_', '-') in ('utf-8', 'utf8'):
+		arrow_table = _arrow_csv_table(subset_df, sep)
+		if arrow_table is not None:
+			if header:
+				target.write(subset_df.iloc[:0].to_csv(sep=sep, index=False, header=True).encode('utf-8'))
+			write_options = pa_csv.WriteOptions(include_header=False, delimiter=sep, quoting_style='none', eol=os.linesep, batch_size=65536)
+			pa_csv.write_csv(arrow_table, target, write_options)
+			return
+
+	subset_df.to_csv(target, sep=sep, encoding=encoding, index=index, header=header)
+
+# convert a DF to an Arrow table of pre-formatted columns that write exactly like DataFrame.to_csv
+# returns None if any column needs pandas' own formatting or quoting
+def _arrow_csv_table(subset_df:pd.DataFrame, sep:str):
+	# one-column rows with a missing value are written as "" by pandas
+	if len(subset_df.columns) < 2:
+		return None
+
+	arrays = []
+	for _, col in subset_df.items():
+		arrow_col = _arrow_csv_column(col, sep)
+		if arrow_col is None:
+			return None
+		arrays.append(arrow_col)
+
+	return pa.Table.from_arrays(arrays, names=[str(num) for num in range(len(arrays))])
+
+def _arrow_csv_column(col:pd.Series, sep:str):
+	col_dtype = col.dtype
+
+	# integers format the same in pandas and Arrow
+	if pd.api.types.is_integer_dtype(col_dtype):
+		return pa.array(col, from_pandas=True)
+
+	# pandas writes floats with numpy's str(), i.e. the shortest repr such as 1.0 or 1e-05
+	if col_dtype == np.float64:
+		return _arrow_csv_floats(col)
+	if isinstance(col_dtype, np.dtype) and col_dtype.kind == 'f':
+		values = col.to_numpy().astype(str)
+		return pa.array(values, mask=col.isna().to_numpy())
+
+	if pd.api.types.is_bool_dtype(col_dtype):
+		return pc.if_else(pa.array(col, from_pandas=True), 'True', 'False')
+
+	if isinstance(col_dtype, np.dtype) and col_dtype.kind == 'M':
+		return _arrow_csv_datetimes(col)
+
+	if pd.api.types.is_string_dtype(col_dtype):
 		try:
-			query = ' '.join([line for line in cur_script])
-			for find, replace in replace_in_query:
-				query = query.replace(find, replace)
-			results_df = bq_client.query(query).to_dataframe()
-		except Exception:
-			print(f'{sql_script} query failed.')
-			if ignore_error:
-				results_df = pd.DataFrame() 
-				return results_df
-			raise
+			arrow_col = pa.array(col, from_pandas=True)
+		except (pa.ArrowInvalid, pa.ArrowTypeError):
+			return None
+		if not pa.types.is_string(arrow_col.type) and not pa.types.is_large_string(arrow_col.type):
+			return None
 
-		if log:
-			print(f'Results: {results_df.shape}')
+		# values that pandas would quote are left to pandas
+		if pc.any(pc.match_substring_regex(arrow_col, f'[{re.escape(sep)}"\r\n]')).as_py():
+			return None
+		return arrow_col
+
+	return None
+
+# Arrow casts doubles to the same shortest digits as repr() but picks its own notation,
+# so only values written in fixed notation with a '.' appended where missing are kept from the cast
+# and the rest (below 1e-4 or from 1e16 in magnitude, or cast in exponent form) go through numpy
+def _arrow_csv_floats(col:pd.Series):
+	values = col.to_numpy()
+	abs_values = np.abs(values)
+	finite = np.isfinite(values)
+	arrow_col = pc.cast(pa.array(values), pa.string())
+
+	slow = finite & (abs_values != 0) & ((abs_values < 1e-4) | (abs_values >= 1e16))
+	slow |= pc.match_substring(arrow_col, 'e').to_numpy(zero_copy_only=False)
+	no_point = finite & ~pc.match_substring(arrow_col, '.').to_numpy(zero_copy_only=False)
+
+	arrow_col = pc.if_else(no_point, pc.binary_join_element_wise(arrow_col, '.0', ''), arrow_col)
+	if slow.any():
+		arrow_col = pc.replace_with_mask(arrow_col, slow, pa.array(values[slow].astype(str)))
+	return pc.if_else(np.isnan(values), pa.scalar(None, pa.string()), arrow_col)
+
+# naive datetimes the way pandas writes them: dates only if every value is midnight,
+# otherwise seconds plus as many fraction digits (3, 6 or 9) as the column needs
+def _arrow_csv_datetimes(col:pd.Series):
+	values = col.to_numpy()
+	mask = np.isnat(values)
+	valid_values = values[~mask]
+
+	# pandas doesn't zero-pad years outside 1000-9999
+	years = valid_values.astype('datetime64[Y]').astype('i8') + 1970
+	if len(years) and (years.min() < 1000 or years.max() > 9999):
+		return None
+
+	ticks = valid_values.view('i8')
+	ticks_per_second = np.timedelta64(1, 's') // np.timedelta64(1, np.datetime_data(values.dtype)[0])
+	arrow_col = pa.array(values, mask=mask)
 
-	return (results_df)
+	if not (ticks % (86400 * ticks_per_second)).any():
+		return pc.strftime(arrow_col, format='%Y-%m-%d')
+
+	fraction = (ticks % ticks_per_second) * (10**9 // ticks_per_second)
+	if (fraction % 1000).any():
+		width = 29
+	elif (fraction % 10**6).any():
+		width = 26
+	elif fraction.any():
+		width = 23
+	else:
+		width = 19
+	return pc.utf8_slice_codeunits(pc.strftime(arrow_col, format='%Y-%m-%d %H:%M:%S'), 0, width)
+
+# write a DF slice to a local CSV file
+def _write_csv_file(subset_df:pd.DataFrame, outfile_path:str, sep:str, encoder:str='pandas'):
+	# Create directory if it doesn't exist
+	if os.path.dirname(outfile_path):
+		os.makedirs(os.path.dirname(outfile_path), exist_ok=True)
+
+	with open(outfile_path, 'wb') as outfile:
+		_encode_csv(subset_df, outfile, sep, encoder=encoder)
+
+# write a DF slice to a local Excel file
+def _write_excel_file(subset_df:pd.DataFrame, outfile_path:str, constant_memory:bool=False, sheet_row:int=0):
+	_write_excel(subset_df, outfile_path, constant_memory, sheet_row)
+
+# encode a DF slice as a CSV binary buffer, gzipped if compress
+def _encode_csv_buffer(subset_df:pd.DataFrame, sep:str, encoder:str='pandas', compress:bool=False) -> BytesIO:
+	cur_buffer = BytesIO()
+	if compress:
+		# mtime=0 keeps the gzip output identical across runs for the same data
+		with gzip.GzipFile(fileobj=cur_buffer, mode='wb', mtime=0) as gzip_buffer:
+			_encode_csv(subset_df, gzip_buffer, sep, encoder=encoder)
+	else:
+		_encode_csv(subset_df, cur_buffer, sep, encoder=encoder)
+	cur_buffer.seek(0)
+	return cur_buffer
+
+# encode a DF slice as a Parquet binary buffer
+# timestamps are written in microseconds, the finest unit BigQuery loads from Parquet
+def _encode_parquet_buffer(subset_df:pd.DataFrame, compression:str='snappy') -> BytesIO:
+	cur_buffer = BytesIO()
+	subset_df.to_parquet(cur_buffer, index=False, compression=compression, coerce_timestamps='us', allow_truncated_timestamps=True)
+	cur_buffer.seek(0)
+	return cur_buffer
+
+# encode a DF slice as an Avro binary buffer, with the schema derived from the DF dtypes
+def _encode_avro_buffer(subset_df:pd.DataFrame, codec:str='deflate') -> BytesIO:
+	avro_schema, converters = _avro_schema(subset_df)
+	avro_schema = fastavro.parse_schema(avro_schema)
+	col_names = list(subset_df.columns)
+	columns = [[convert(value) for value in subset_df[col_name].tolist()] for col_name, convert in zip(col_names, converters)]
+
+	cur_buffer = BytesIO()
+	records = (dict(zip(col_names, row)) for row in zip(*columns))
+	fastavro.writer(cur_buffer, avro_schema, records, codec=codec)
+	cur_buffer.seek(0)
+	return cur_buffer
+
+# Avro record schema for a DF, every field nullable, plus one converter per column that turns NaN/NaT into None
+# datetimes become timestamp-micros, so BigQuery loads them as TIMESTAMP with use_avro_logical_types
+def _avro_schema(subset_df:pd.DataFrame) -> tuple:
+	fields = []
+	converters = []
+	for col_name, dtype in subset_df.dtypes.items():
+		if pd.api.types.is_bool_dtype(dtype):
+			avro_type, convert = 'boolean', _avro_value(bool)
+		elif pd.api.types.is_integer_dtype(dtype):
+			avro_type, convert = 'long', _avro_value(int)
+		elif pd.api.types.is_float_dtype(dtype):
+			avro_type, convert = 'double', _avro_value(float)
+		elif pd.api.types.is_datetime64_any_dtype(dtype):
+			avro_type, convert = {'type': 'long', 'logicalType': 'timestamp-micros'}, _avro_value(lambda value: value.to_pydatetime())
+		else:
+			avro_type, convert = 'string', _avro_value(lambda value: value if isinstance(value, str) else str(value))
+		fields.append({'name': str(col_name), 'type': ['null', avro_type]})
+		converters.append(convert)
+
+	return {'type': 'record', 'name': 'Row', 'fields': fields}, converters
+
+def _avro_value(convert):
+	return lambda value: None if pd.isna(value) else convert(value)
+
+# encode a DF slice as an xlsx binary buffer
+def _encode_excel_buffer(subset_df:pd.DataFrame, constant_memory:bool=False, sheet_row:int=0) -> BytesIO:
+	cur_buffer = BytesIO()
+	_write_excel(subset_df, cur_buffer, constant_memory, sheet_row)
+	cur_buffer.seek(0)
+	return cur_buffer
+
+# write a DF slice to an xlsx file or buffer
+# sheet_row > 0 rolls the rows over into Sheet1, Sheet2... of the same workbook
+# constant_memory streams rows to the file through xlsxwriter instead of building the workbook in memory first
+def _write_excel(subset_df:pd.DataFrame, target, constant_memory:bool=False, sheet_row:int=0):
+	sheet_row = sheet_row or len(subset_df) or 1
+	sheets = [
+		(f'Sheet{sheet_num}', subset_df.iloc[cur_row:cur_row + sheet_row])
+		for sheet_num, cur_row in enumerate(range(0, max(len(subset_df), 1), sheet_row), start=1)
+	]
+
+	if not constant_memory:
+		with pd.ExcelWriter(target, engine='xlsxwriter') as writer:
+			for sheet_name, sheet_df in sheets:
+				sheet_df.to_excel(writer, sheet_name=sheet_name, index=False, header=True)
+		return
+
+	workbook = xlsxwriter.Workbook(target, {'constant_memory': True})
+	try:
+		# same header style and number formats as pandas' xlsxwriter output
+		header_format = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+		cell_formats = {
+			'datetime': workbook.add_format({'num_format': 'YYYY-MM-DD HH:MM:SS'}),
+			'date': workbook.add_format({'num_format': 'YYYY-MM-DD'}),
+			'timedelta': workbook.add_format({'num_format': '0'})
+		}
+
+		for sheet_name, sheet_df in sheets:
+			worksheet = workbook.add_worksheet(sheet_name)
+			worksheet.write_row(0, 0, [_excel_value(col, cell_formats)[0] for col in sheet_df.columns], header_format)
+			_write_excel_rows(worksheet, sheet_df, cell_formats)
+	finally:
+		workbook.close()
+
+# write DF rows to a constant_memory worksheet, a block of rows at a time
+# values are read column by column from the DF's arrays; missing values are left blank
+def _write_excel_rows(worksheet, sheet_df:pd.DataFrame, cell_formats:dict, block_row:int=10000):
+	for col_name, col_dtype in sheet_df.dtypes.items():
+		if isinstance(col_dtype, pd.DatetimeTZDtype):
+			raise ValueError(f'Excel does not support datetimes with timezones. Remove the timezone from {col_name} before exporting.')
+
+	for block_start in range(0, len(sheet_df), block_row):
+		block_df = sheet_df.iloc[block_start:block_start + block_row]
+		columns = [_excel_column(col, cell_formats) for _, col in block_df.items()]
+
+		for row_num, row in enumerate(zip(*columns), start=block_start + 1):
+			for col_num, (value, value_format) in enumerate(row):
+				if value is not None:
+					worksheet.write(row_num, col_num, value, value_format)
+
+_EXCEL_INF = {np.inf: 'inf', -np.inf: '-inf'}
+
+# (value, format) pairs for one column, converted the way pandas' ExcelFormatter converts cells
+# integer, bool and datetime64 columns share one format; other columns are converted value by value
+def _excel_column(col:pd.Series, cell_formats:dict) -> list:
+	values = col.tolist()
+	if col.hasnans:
+		values = [None if is_na else value for value, is_na in zip(values, col.isna().tolist())]
+
+	if col.dtype.kind in 'iub':
+		return [(value, None) for value in values]
+	if col.dtype.kind == 'M':
+		return [(value, cell_formats['datetime']) for value in values]
+	if col.dtype.kind == 'f':
+		return [(_EXCEL_INF.get(value, value), None) for value in values]
+	return [(None, None) if value is None else _excel_value(value, cell_formats) for value in values]
+
+# one cell value and its format, as pandas writes it: inf as the string 'inf', timedeltas as days in the '0'
+# number format, dates and datetimes in the date formats and any other object as its string
+def _excel_value(value, cell_formats:dict) -> tuple:
+	if isinstance(value, (bool, np.bool_)):
+		return bool(value), None
+	if isinstance(value, (int, np.integer)):
+		return int(value), None
+	if isinstance(value, (float, np.floating)):
+		return _EXCEL_INF.get(float(value), float(value)), None
+	if isinstance(value, Decimal):
+		return value, None
+	if getattr(value, 'tzinfo', None) is not None:
+		raise ValueError('Excel does not support datetimes with timezones. Remove the timezone before exporting.')
+	if isinstance(value, datetime):
+		return value, cell_formats['datetime']
+	if isinstance(value, date):
+		return value, cell_formats['date']
+	if isinstance(value, timedelta):
+		return value.total_seconds() / 86400, cell_formats['timedelta']
+	return str(value), None
 
 # export DF as CSV file
-def df_to_csv(df:pd.DataFrame, slice_row:int, outfile_path:str, sep:str=',', dlt_dir:bool=False, log:bool=False, ignore_error:bool=False):
+def df_to_csv(df:pd.DataFrame, slice_row:int, outfile_path:str, sep:str=',', dlt_dir:bool=False, log:bool=False, ignore_error:bool=False, workers:int=1, encoder:str='pandas'):
 	if not 0 < slice_row <= 1000000:
 		raise ValueError('Invalid slice length.')
 	
@@ -89,42 +957,32 @@ def df_to_csv(df:pd.DataFrame, slice_row:int, outfile_path:str, sep:str=',', dlt
 				raise
 
 	else:
-		for cur_row in range(0, len(df), slice_row):
-			try:
-				file_ver = cur_row // slice_row + 1
-				subset_df = df.iloc[cur_row:cur_row + slice_row]
-				new_outfile_path = outfile_path.replace('.csv', f'_{file_ver}.csv')
-
-				if log:
-					print(f'{datetime.now()} creating CSV file {new_outfile_path}')
-
-				# Create directory if it doesn't exist
-				os.makedirs(os.path.dirname(new_outfile_path), exist_ok=True)
-				
-				subset_df.to_csv(
-					path_or_buf=new_outfile_path, 
-					sep=sep,
-					encoding='utf-8',
-					index=False,
-					header=True
-				)
-
-				if log:
-					print(f'{datetime.now()} {new_outfile_path} created')
-
-			except Exception as error:
+		slices = _named_slices(df, slice_row, outfile_path, '.csv')
+		tasks = ((new_outfile_path, (subset_df, new_outfile_path, sep, encoder)) for new_outfile_path, subset_df in slices)
+		for new_outfile_path, _, error, elapsed in _run_slices(_write_csv_file, tasks, workers, log_label='CSV file' if log else None):
+			if error:
 				print(f"Error creating {new_outfile_path}.\n\n{error}")
 				if not ignore_error:
-					raise
+					raise error
+				continue
+
+			if log:
+				print(f'{datetime.now()} {new_outfile_path} created ({elapsed:.2f}s)')
 	if dlt_dir:
 		os.rmdir(dir)
 		if log:
 			print(f"{datetime.now()} deleted {dir}")
 
-# export DF as Excel file
-def df_to_excel(df, slice_row:int, outfile_path:str, dlt_dir:bool=False,  log:bool=False, ignore_error:bool=False):
-	if not 0 < slice_row <= 1000000:
+# Excel sheets hold up to 1,048,576 rows, so slices above 1,000,000 rows must roll over into more sheets
+def _check_excel_slices(slice_row:int, sheet_row:int):
+	if not 0 <= sheet_row <= 1000000:
+		raise ValueError('Invalid sheet length.')
+	if not 0 < slice_row or (not sheet_row and slice_row > 1000000):
 		raise ValueError('Invalid slice length.')
+
+# export DF as Excel file
+def df_to_excel(df, slice_row:int, outfile_path:str, dlt_dir:bool=False,  log:bool=False, ignore_error:bool=False, workers:int=1, constant_memory:bool=False, sheet_row:int=0):
+	_check_excel_slices(slice_row, sheet_row)
 	
 	# Extract dir path from file path and create dir if it doesn't exist yet.
 	if '/' in outfile_path:
@@ -141,8 +999,7 @@ def df_to_excel(df, slice_row:int, outfile_path:str, dlt_dir:bool=False,  log:bo
 			# Create directory if it doesn't exist
 			os.makedirs(os.path.dirname(outfile_path), exist_ok=True)
 			
-			with pd.ExcelWriter(outfile_path, engine='xlsxwriter') as writer:
-				df.to_excel(writer, index=False, header=True)
+			_write_excel(df, outfile_path, constant_memory, sheet_row)
 
 			if log:
 				print(f'{datetime.now()} {outfile_path} created')
@@ -153,25 +1010,17 @@ def df_to_excel(df, slice_row:int, outfile_path:str, dlt_dir:bool=False,  log:bo
 				raise
 
 	else:
-		for cur_row in range(0, len(df), slice_row):
-			try:
-				file_ver = cur_row // slice_row + 1
-				subset_df = df.iloc[cur_row:cur_row + slice_row]
-				new_outfile_path = outfile_path.replace('.xlsx', f'_{file_ver}.xlsx')
-
-				if log:
-					print(f'{datetime.now()} creating Excel file {new_outfile_path}')
-
-				with pd.ExcelWriter(new_outfile_path, engine='xlsxwriter') as writer:
-					subset_df.to_excel(writer, index=False, header=True)
-
-				if log:
-					print(f'{datetime.now()} {new_outfile_path} created')
-
-			except Exception as error:
+		slices = _named_slices(df, slice_row, outfile_path, '.xlsx')
+		tasks = ((new_outfile_path, (subset_df, new_outfile_path, constant_memory, sheet_row)) for new_outfile_path, subset_df in slices)
+		for new_outfile_path, _, error, elapsed in _run_slices(_write_excel_file, tasks, workers, use_processes=True, log_label='Excel file' if log else None):
+			if error:
 				print(f"Failed to create Excel file {new_outfile_path}.\n\n{error}")
 				if not ignore_error:
-					raise
+					raise error
+				continue
+
+			if log:
+				print(f'{datetime.now()} {new_outfile_path} created ({elapsed:.2f}s)')
 	
 	if dlt_dir:
 		os.rmdir(dir)
@@ -179,7 +1028,8 @@ def df_to_excel(df, slice_row:int, outfile_path:str, dlt_dir:bool=False,  log:bo
 			print(f"{datetime.now()} deleted {dir}")
 
 # export DF as CSV binary file
-def df_to_csv_bin(df:pd.DataFrame, slice_row:int, outfile_name:str, sep:str=',', log:bool=False, ignore_error:bool=False) -> List[Tuple]:
+# compress gzips every slice and appends .gz to the file names
+def df_to_csv_bin(df:pd.DataFrame, slice_row:int, outfile_name:str, sep:str=',', log:bool=False, ignore_error:bool=False, workers:int=1, encoder:str='pandas', compress:bool=False) -> List[Tuple]:
 	if not 0 < slice_row <= 1000000:
 		raise ValueError('Invalid slice length.')
 	
@@ -210,40 +1060,27 @@ def df_to_csv_bin(df:pd.DataFrame, slice_row:int, outfile_name:str, sep:str=',',
 				raise
 
 	else:
-		for cur_row in range(0, len(df), slice_row):
-			try:
-				file_ver = cur_row // slice_row + 1
-				subset_df = df.iloc[cur_row:cur_row + slice_row]
-				new_outfile_name = outfile_name.replace('.csv', f'_{file_ver}.csv')
-
-				if log:
-					print(f'{datetime.now()} creating CSV binary file for {new_outfile_name}')
-
-				cur_buffer = BytesIO()
-				subset_df.to_csv(
-					path_or_buf=cur_buffer, 
-					sep=sep,
-					encoding='utf-8',
-					index=False,
-					header=True
-				)
-				cur_buffer.seek(0)
-				csv_buffers.append((new_outfile_name, cur_buffer))
-
-				if log:
-					print(f'{datetime.now()} {new_outfile_name} CSV binary created')
-
-			except Exception as error:
+		slices = _named_slices(df, slice_row, outfile_name, '.csv')
+		tasks = (
+			(f'{new_outfile_name}.gz' if compress else new_outfile_name, (subset_df, sep, encoder, compress))
+			for new_outfile_name, subset_df in slices
+		)
+		for new_outfile_name, cur_buffer, error, elapsed in _run_slices(_encode_csv_buffer, tasks, workers, log_label='CSV binary file for' if log else None):
+			if error:
 				print(f"Error creating {new_outfile_name}.\n\n{error}")
 				if not ignore_error:
-					raise
+					raise error
+				continue
+
+			csv_buffers.append((new_outfile_name, cur_buffer))
+			if log:
+				print(f'{datetime.now()} {new_outfile_name} CSV binary created ({elapsed:.2f}s)')
 	
 	return csv_buffers
 
 # export DF as Excel binary file
-def df_to_excel_bin(df, slice_row:int, outfile_name:str, log=False, ignore_eror=False) -> List[Tuple]:
-	if not 0 < slice_row <= 1000000:
-		raise ValueError('Invalid slice length.')
+def df_to_excel_bin(df, slice_row:int, outfile_name:str, log=False, ignore_eror=False, workers:int=1, constant_memory:bool=False, sheet_row:int=0) -> List[Tuple]:
+	_check_excel_slices(slice_row, sheet_row)
 
 	excel_buffers = []
 
@@ -252,10 +1089,8 @@ def df_to_excel_bin(df, slice_row:int, outfile_name:str, log=False, ignore_eror=
 			if log:
 				print(f'{datetime.now()} creating xlsx binary file for {outfile_name}')
 
-			cur_buffer = BytesIO()
-			with pd.ExcelWriter(cur_buffer, engine='xlsxwriter') as file_buffer:
-				df.to_excel(file_buffer, index=False, header=True)
-			excel_buffers.append(outfile_name, cur_buffer.seek(0))
+			cur_buffer = _encode_excel_buffer(df, constant_memory, sheet_row)
+			excel_buffers.append((outfile_name, cur_buffer))
 
 			if log:
 				print(f'{datetime.now()} {outfile_name} binary created')
@@ -266,32 +1101,121 @@ def df_to_excel_bin(df, slice_row:int, outfile_name:str, log=False, ignore_eror=
 				raise
 
 	else:
-		try:
-			# slice the results of each script
-			for cur_row in range(0, len(df), slice_row):
-				file_ver = cur_row // slice_row + 1
-				subset_df = df.iloc[cur_row:cur_row + slice_row]
-				new_outfile_name = outfile_name.replace('.xlsx', f'_{file_ver}.xlsx')
+		# slice the results of each script
+		slices = _named_slices(df, slice_row, outfile_name, '.xlsx')
+		tasks = ((new_outfile_name, (subset_df, constant_memory, sheet_row)) for new_outfile_name, subset_df in slices)
+		for new_outfile_name, cur_buffer, error, elapsed in _run_slices(_encode_excel_buffer, tasks, workers, use_processes=True, log_label='xlsx binary file for' if log else None):
+			if error:
+				print(f"Failed to create xlsx binary file for {new_outfile_name}.\n\n{error}")
+				if not ignore_eror:
+					raise error
+				continue
 
-				if log:
-					print(f'{datetime.now()} creating xlsx binary file for {new_outfile_name}')
+			# add the buffer data and file name to the main list
+			excel_buffers.append((new_outfile_name, cur_buffer))
+			if log:
+				print(f'{datetime.now()} {new_outfile_name} binary created ({elapsed:.2f}s)')
+	
+	return excel_buffers
+
+# =================================
+# = Parquet and Avro binary files =
+# =================================
 
-				# init binary buffer for xlsx file
-				cur_buffer = BytesIO()
+# export DF as Parquet binary files: sales.parquet -> sales_1.parquet, sales_2.parquet...
+# compression: 'snappy', 'gzip', 'zstd' or None
+def df_to_parquet_bin(df:pd.DataFrame, slice_row:int, outfile_name:str, log:bool=False, ignore_error:bool=False, workers:int=1, compression:str='snappy') -> List[Tuple]:
+	if not 0 < slice_row <= 1000000:
+		raise ValueError('Invalid slice length.')
 
-				with pd.ExcelWriter(cur_buffer, engine='xlsxwriter') as writer:
-					subset_df.to_excel(writer, index=False, header=True)
-				cur_buffer.seek(0)
+	slices = _named_slices(df, slice_row, outfile_name, '.parquet')
+	tasks = ((new_outfile_name, (subset_df, compression)) for new_outfile_name, subset_df in slices)
+	return _collect_buffers(_encode_parquet_buffer, tasks, workers, 'Parquet binary file for', log, ignore_error)
 
-				# add the buffer data and file name to the main list
-				excel_buffers.append((new_outfile_name, cur_buffer))
+# export DF as Avro binary files: sales.avro -> sales_1.avro, sales_2.avro...
+# needs the fastavro package; codec: 'deflate', 'snappy' (needs cramjam) or 'null'
+def df_to_avro_bin(df:pd.DataFrame, slice_row:int, outfile_name:str, log:bool=False, ignore_error:bool=False, workers:int=1, codec:str='deflate') -> List[Tuple]:
+	if fastavro is None:
+		raise ImportError('df_to_avro_bin needs the fastavro package: pip install fastavro')
+	if not 0 < slice_row <= 1000000:
+		raise ValueError('Invalid slice length.')
 
-				if log:
-					print(f'{datetime.now()} {new_outfile_name} binary created')
+	slices = _named_slices(df, slice_row, outfile_name, '.avro')
+	tasks = ((new_outfile_name, (subset_df, codec)) for new_outfile_name, subset_df in slices)
+	return _collect_buffers(_encode_avro_buffer, tasks, workers, 'Avro binary file for', log, ignore_error)
 
-		except Exception as error:
-			print(f"Failed to create xlsx binary file for {new_outfile_name}.\n\n{error}")
-			if not ignore_eror:
-				raise
-	
-	return excel_buffers
\ No newline at end of file
+# encode every slice and return the (file name, buffer) pairs in slice order
+def _collect_buffers(task, tasks, workers:int, log_label:str, log:bool, ignore_error:bool) -> List[Tuple]:
+	file_buffers = []
+	for new_outfile_name, cur_buffer, error, elapsed in _run_slices(task, tasks, workers, log_label=log_label if log else None):
+		if error:
+			print(f"Error creating {new_outfile_name}.\n\n{error}")
+			if not ignore_error:
+				raise error
+			continue
+
+		file_buffers.append((new_outfile_name, cur_buffer))
+		if log:
+			print(f'{datetime.now()} {new_outfile_name} binary created ({elapsed:.2f}s)')
+
+	return file_buffers
+
+# =====================
+# = Lazy binary files =
+# =====================
+
+# export DF as CSV binary files, one buffer at a time
+# buffers are SpooledTemporaryFiles that spill to disk above spool_bytes; compress gzips them as *.csv.gz
+def df_to_csv_bin_iter(df:pd.DataFrame, slice_row:int, outfile_name:str, sep:str=',', log:bool=False, ignore_error:bool=False, spool_bytes:int=32*1024**2, compress:bool=False, encoding:str='utf-8', index:bool=False, header:bool=True, encoder:str='pandas') -> Iterator[Tuple]:
+	if not 0 < slice_row <= 1000000:
+		raise ValueError('Invalid slice length.')
+
+	slices = _named_slices(df, slice_row, outfile_name, '.csv')
+	tasks = (
+		(f'{new_outfile_name}.gz' if compress else new_outfile_name, (subset_df, sep, encoding, index, header, spool_bytes, compress, encoder))
+		for new_outfile_name, subset_df in slices
+	)
+	return _lazy_buffers(_spool_csv_buffer, tasks, 'CSV binary file for', log, ignore_error)
+
+# export DF as Excel binary files, one buffer at a time
+# buffers are SpooledTemporaryFiles that spill to disk above spool_bytes
+def df_to_excel_bin_iter(df, slice_row:int, outfile_name:str, log:bool=False, ignore_error:bool=False, spool_bytes:int=32*1024**2, constant_memory:bool=False, sheet_row:int=0) -> Iterator[Tuple]:
+	_check_excel_slices(slice_row, sheet_row)
+
+	slices = _named_slices(df, slice_row, outfile_name, '.xlsx')
+	tasks = ((new_outfile_name, (subset_df, spool_bytes, constant_memory, sheet_row)) for new_outfile_name, subset_df in slices)
+	return _lazy_buffers(_spool_excel_buffer, tasks, 'xlsx binary file for', log, ignore_error)
+
+# yield (file name, buffer) pairs as each slice is encoded
+# only the buffer being consumed is alive, unless the caller keeps references to earlier ones
+def _lazy_buffers(task, tasks, log_label:str, log:bool, ignore_error:bool):
+	for new_outfile_name, cur_buffer, error, elapsed in _run_slices(task, tasks, log_label=log_label if log else None):
+		if error:
+			print(f"Error creating {new_outfile_name}.\n\n{error}")
+			if not ignore_error:
+				raise error
+			continue
+
+		if log:
+			print(f'{datetime.now()} {new_outfile_name} binary created ({elapsed:.2f}s)')
+		yield new_outfile_name, cur_buffer
+
+def _spool_csv_buffer(subset_df:pd.DataFrame, sep:str, encoding:str, index:bool, header:bool, spool_bytes:int, compress:bool, encoder:str='pandas') -> SpooledTemporaryFile:
+	cur_buffer = SpooledTemporaryFile(max_size=spool_bytes)
+	csv_args = {'sep': sep, 'encoding': encoding, 'index': index, 'header': header, 'encoder': encoder}
+
+	if compress:
+		# mtime=0 keeps the gzip output identical across runs for the same data
+		with gzip.GzipFile(fileobj=cur_buffer, mode='wb', mtime=0) as gzip_buffer:
+			_encode_csv(subset_df, gzip_buffer, **csv_args)
+	else:
+		_encode_csv(subset_df, cur_buffer, **csv_args)
+
+	cur_buffer.seek(0)
+	return cur_buffer
+
+def _spool_excel_buffer(subset_df:pd.DataFrame, spool_bytes:int, constant_memory:bool, sheet_row:int) -> SpooledTemporaryFile:
+	cur_buffer = SpooledTemporaryFile(max_size=spool_bytes)
+	_write_excel(subset_df, cur_buffer, constant_memory, sheet_row)
+	cur_buffer.seek(0)
+	return cur_buffer
@@ -5,11 +5,15 @@ Mandatory
 '''
 
 # content mimetype for Google Sheets ad GCP
+# source_format: BigQuery load format for files the bucket loaders can load by URI
 content_data = {
-	'.csv': {'content_type': 'text/csv', 'type_name': 'CSV'},
+	'.csv': {'content_type': 'text/csv', 'type_name': 'CSV', 'source_format': bq.SourceFormat.CSV},
 	'.txt': {'content_type': 'text/plain', 'type_name': 'Text'},
 	'.xlsx': {'content_type': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'type_name': 'Excel'},
-	'.log': {'content_type': 'text/plain', 'type_name': 'Log'}
+	'.log': {'content_type': 'text/plain', 'type_name': 'Log'},
+	'.csv.gz': {'content_type': 'application/gzip', 'type_name': 'Gzip CSV', 'source_format': bq.SourceFormat.CSV},
+	'.parquet': {'content_type': 'application/vnd.apache.parquet', 'type_name': 'Parquet', 'source_format': bq.SourceFormat.PARQUET},
+	'.avro': {'content_type': 'application/avro', 'type_name': 'Avro', 'source_format': bq.SourceFormat.AVRO}
 }
 
 # example of extra formats: BigQuery schema definition
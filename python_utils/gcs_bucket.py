@@ -1,20 +1,397 @@
+import io
 import os
+import gzip
+import json
+import mmap
+import time
+import uuid
+import base64
+import hashlib
 import calendar
-from typing import Optional, List
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, FIRST_EXCEPTION, wait
+from typing import Iterable, Optional, List
 from google.cloud import bigquery as bq
 from python_utils.formats import content_data
+from python_utils.utils import get_file_ext, _run_slices
+from python_utils.bigquery import bq_to_df_iter, _encode_csv, _named_slices
 from typing import List, Tuple
 
+# optional: only needed to sync against composite objects, which have a CRC32C but no MD5
+try:
+	import google_crc32c
+except ImportError:
+	google_crc32c = None
+
 OS = os.name
 
+# listings of bucket prefixes are reused for this many seconds by the 'i' (ignore) upload mode
+BUCKET_INDEX_TTL = 60
+
+_bucket_index = {}	# (bucket_id, prefix) -> (listed at, {object name: (md5_hash, crc32c, size)})
+_bucket_index_lock = threading.Lock()
+
+# parallel composite uploads: GCS composes up to 32 objects per call and up to 1024 components per object
+COMPOSE_MAX_SOURCES = 32
+COMPOSE_MAX_COMPONENTS = 1024
+COMPOSITE_TMP_PREFIX = '_composite_parts/'
+
+'''
+Bucket object index
+'''
+
+# names and checksums of the objects directly under prefix (e.g. 'folder1/folder2/'), from one paged listing
+# the listing is cached and reused for ttl seconds so repeated calls in a job skip the round trip; ttl=0 always lists again
+def bucket_object_index(storage_client, bucket_id:str, prefix:str='', ttl:float=BUCKET_INDEX_TTL, log=False) -> dict:
+	key = (bucket_id, prefix)
+	with _bucket_index_lock:
+		cached = _bucket_index.get(key)
+	if cached and ttl and time.monotonic() - cached[0] < ttl:
+		return cached[1]
+
+	# delimiter keeps the listing to the objects directly under prefix instead of the whole subtree
+	blobs = storage_client.list_blobs(
+		bucket_id,
+		prefix=prefix or None,
+		delimiter='/',
+		fields='items(name,md5Hash,crc32c,size),nextPageToken,prefixes'
+	)
+	index = {blob.name: (blob.md5_hash, blob.crc32c, blob.size) for blob in blobs}
+
+	if log:
+		print(f'{datetime.now()} listed {len(index)} objects in gs://{bucket_id}/{prefix}')
+
+	with _bucket_index_lock:
+		_bucket_index[key] = (time.monotonic(), index)
+	return index
+
+# drop cached listings for one prefix, for a whole bucket, or for every bucket if bucket_id is None
+# call after writing to a bucket from outside this module within the ttl
+def invalidate_bucket_index(bucket_id:str=None, prefix:str=None):
+	with _bucket_index_lock:
+		for key in list(_bucket_index):
+			if bucket_id is None or (key[0] == bucket_id and (prefix is None or key[1] == prefix)):
+				del _bucket_index[key]
+
+# the listing prefix an object lives under, e.g. 'folder1/folder2/' for 'folder1/folder2/sales.csv'
+def _blob_prefix(full_bucket_path:str) -> str:
+	return full_bucket_path[:full_bucket_path.rfind('/') + 1]
+
+# add an uploaded object to its cached listing so later calls within the ttl see it
+def _index_upload(bucket_id:str, full_bucket_path:str, checksums:tuple=(None, None, None)):
+	with _bucket_index_lock:
+		cached = _bucket_index.get((bucket_id, _blob_prefix(full_bucket_path)))
+		if cached:
+			cached[1][full_bucket_path] = checksums
+
+'''
+Checksum sync
+'''
+
+# local record of file checksums keyed by absolute path, so sync mode only re-hashes files whose size or mtime changed
+# saved as JSON; writes go to a temp file first so an interrupted save never leaves a partial manifest
+class Sync_Manifest:
+	def __init__(self, path:str):
+		self.path = path
+		self.entries = {}
+		self._dirty = False
+		self._lock = threading.Lock()
+
+		if os.path.exists(path):
+			with open(path, 'r') as manifest_file:
+				self.entries = json.load(manifest_file)
+
+	# cached (md5, crc32c) of a local file, or None if the file changed since it was hashed
+	def get(self, file_path:str):
+		stat = os.stat(file_path)
+		with self._lock:
+			entry = self.entries.get(os.path.abspath(file_path))
+		if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+			return entry['md5'], entry['crc32c']
+		return None
+
+	def put(self, file_path:str, checksums:tuple):
+		stat = os.stat(file_path)
+		md5, crc32c = checksums
+		with self._lock:
+			# keep the other checksum if the file hasn't changed since it was recorded
+			entry = self.entries.get(os.path.abspath(file_path))
+			if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+				md5, crc32c = md5 or entry['md5'], crc32c or entry['crc32c']
+
+			self.entries[os.path.abspath(file_path)] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'md5': md5, 'crc32c': crc32c}
+			self._dirty = True
+
+	def save(self):
+		with self._lock:
+			if not self._dirty:
+				return
+			tmp_path = f'{self.path}.{os.getpid()}.tmp'
+			with open(tmp_path, 'w') as manifest_file:
+				json.dump(self.entries, manifest_file)
+			os.replace(tmp_path, self.path)
+			self._dirty = False
+
+# base64 MD5 or CRC32C of a binary file object, in the form GCS reports them (md5_hash, crc32c)
+# returns (md5, None) or (None, crc32c); the position is reset to the start afterwards
+def _file_checksums(file_obj, use_md5:bool=True) -> tuple:
+	checksum = hashlib.md5() if use_md5 else google_crc32c.Checksum()
+	file_obj.seek(0)
+	while chunk := file_obj.read(1024**2):
+		checksum.update(chunk)
+	file_obj.seek(0)
+
+	digest = base64.b64encode(checksum.digest()).decode('utf-8')
+	return (digest, None) if use_md5 else (None, digest)
+
+# True if the local content matches the listed object (md5_hash, crc32c, size)
+# sizes are compared first; MD5 is used when the object has one, otherwise CRC32C if google-crc32c is installed
+def _is_unchanged(file_obj, size:int, remote:tuple, manifest:Sync_Manifest=None, file_path:str=None) -> bool:
+	if remote is None or remote[2] is None or int(remote[2]) != size:
+		return False
+
+	remote_md5, remote_crc32c, _ = remote
+	use_md5 = remote_md5 is not None
+	if not use_md5 and (remote_crc32c is None or google_crc32c is None):
+		return False
+
+	checksum_num = 0 if use_md5 else 1
+	checksums = manifest.get(file_path) if manifest is not None else None
+	if checksums is None or checksums[checksum_num] is None:
+		checksums = _file_checksums(file_obj, use_md5)
+		if manifest is not None:
+			manifest.put(file_path, checksums)
+
+	return checksums[checksum_num] == (remote_md5 if use_md5 else remote_crc32c)
+
+'''
+Parallel composite upload
+'''
+
+# read-only file object over a slice of a memory-mapped file, so each part is read straight from the page cache
+class _Mmap_Range(io.RawIOBase):
+	def __init__(self, view:memoryview):
+		self._view = view
+		self._pos = 0
+
+	def readable(self) -> bool:
+		return True
+
+	def seekable(self) -> bool:
+		return True
+
+	def readinto(self, buffer) -> int:
+		chunk = self._view[self._pos:self._pos + len(buffer)]
+		buffer[:len(chunk)] = chunk
+		self._pos += len(chunk)
+		return len(chunk)
+
+	def readall(self) -> bytes:
+		data = bytes(self._view[self._pos:])
+		self._pos = len(self._view)
+		return data
+
+	def seek(self, offset:int, whence:int=io.SEEK_SET) -> int:
+		base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+		self._pos = max(0, base + offset)
+		return self._pos
+
+	def tell(self) -> int:
+		return self._pos
+
+# upload a large local file as parts on a thread pool, compose them into blob and delete the parts
+# parts are named under COMPOSITE_TMP_PREFIX and are removed even if the upload fails
+# the final object is a composite object: it has a CRC32C checksum but no MD5
+def _composite_upload(bucket, blob, file_path:str, content_type:str, part_size:int, workers:int, log=False):
+	file_size = os.path.getsize(file_path)
+	part_size = max(part_size, -(-file_size // COMPOSE_MAX_COMPONENTS))
+	tmp_prefix = f'{COMPOSITE_TMP_PREFIX}{uuid.uuid4().hex}/'
+	ranges = [(start, min(start + part_size, file_size)) for start in range(0, file_size, part_size)]
+
+	if log:
+		print(f'{datetime.now()} uploading {file_path} as {len(ranges)} parts of {part_size / 1024**2:.1f} MiB')
+
+	temp_blobs = []
+	with ThreadPoolExecutor(max_workers=workers) as pool:
+		try:
+			with open(file_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as file_map:
+				part_views = [memoryview(file_map)[start:end] for start, end in ranges]
+				part_futures = []
+				try:
+					for part_num, part_view in enumerate(part_views):
+						part_futures.append(pool.submit(_upload_part, bucket, f'{tmp_prefix}part-{part_num:05d}', part_view, content_type))
+					wait(part_futures, return_when=FIRST_EXCEPTION)
+				finally:
+					# stop at the first failed part; the mapping can only close once no part is reading it
+					for future in part_futures:
+						future.cancel()
+					wait(part_futures)
+					for part_view in part_views:
+						part_view.release()
+
+			uploaded = [future for future in part_futures if not future.cancelled() and future.exception() is None]
+			temp_blobs.extend(future.result() for future in uploaded)
+			if len(uploaded) < len(ranges):
+				raise next(future.exception() for future in part_futures if not future.cancelled() and future.exception())
+
+			_compose_tree(pool, bucket, temp_blobs[:], blob, content_type, tmp_prefix, temp_blobs)
+		finally:
+			# best effort: a leftover part only costs storage and can be removed with a lifecycle rule on COMPOSITE_TMP_PREFIX
+			for delete_error in pool.map(_delete_quietly, temp_blobs):
+				if delete_error and log:
+					print(f'Unable to delete temporary part: {delete_error}')
+
+def _upload_part(bucket, part_name:str, part_view:memoryview, content_type:str):
+	part_blob = bucket.blob(part_name)
+	with _Mmap_Range(part_view) as part_file:
+		part_blob.upload_from_file(part_file, size=len(part_view), content_type=content_type)
+	return part_blob
+
+# compose sources into blob, COMPOSE_MAX_SOURCES at a time, through levels of intermediate objects
+# each intermediate object is added to temp_blobs as soon as it exists, so the caller's cleanup deletes it
+# even if a later compose fails; a failed level waits for its other composes before raising
+def _compose_tree(pool, bucket, sources:list, blob, content_type:str, tmp_prefix:str, temp_blobs:list):
+	level = 0
+	while len(sources) > COMPOSE_MAX_SOURCES:
+		groups = [sources[start:start + COMPOSE_MAX_SOURCES] for start in range(0, len(sources), COMPOSE_MAX_SOURCES)]
+		group_blobs = [bucket.blob(f'{tmp_prefix}compose-{level}-{group_num:05d}') for group_num in range(len(groups))]
+		compose_futures = [pool.submit(_compose, group_blob, group, content_type, temp_blobs) for group_blob, group in zip(group_blobs, groups)]
+		wait(compose_futures)
+		for future in compose_futures:
+			future.result()
+		sources = group_blobs
+		level += 1
+
+	_compose(blob, sources, content_type)
+
+# created: list the composed blob is appended to once it exists
+def _compose(blob, sources:list, content_type:str, created:list=None):
+	blob.content_type = content_type
+	blob.compose(sources)
+	if created is not None:
+		created.append(blob)
+
+def _delete_quietly(blob):
+	try:
+		blob.delete()
+	except Exception as error:
+		return error
+	return None
+
+'''
+Query results to Bucket
+'''
+
+# stream query results into the bucket as CSV, one object per slice: sales.csv -> sales_1.csv, sales_2.csv...
+# result pages are downloaded while earlier slices are encoded straight into resumable blob writers on worker threads,
+# so neither the full DF nor the full list of encoded files is ever in memory - at most 2 x workers slices are
+# chunk_size is the resumable upload chunk and must be a multiple of 256 KiB
+def bq_to_bucket(bq_client,
+				 storage_client,
+				 sql_script:str,
+				 slice_row:int,
+				 bucket_id:str,
+				 bucket_dir_path:str,
+				 outfile_name:str,
+				 replace_in_query:list=[],
+				 sep:str=',',
+				 encoding:str='utf-8',
+				 index:bool=False,
+				 header:bool=True,
+				 compress:bool=False,
+				 encoder:str='pandas',
+				 workers:int=4,
+				 chunk_size:int=8*1024**2,
+				 log:bool=False,
+				 ignore_error:bool=False
+) -> List[dict]:
+	if get_file_ext(outfile_name) != '.csv':
+		raise ValueError('Invalid file type. outfile_name must end with .csv')
+	if chunk_size <= 0 or chunk_size % (256 * 1024):
+		raise ValueError('Invalid chunk size. Must be a multiple of 256 KiB.')
+
+	bucket = storage_client.bucket(bucket_id)
+	content_type = content_data['.csv.gz' if compress else '.csv']['content_type']
+	csv_args = (sep, encoding, index, header, encoder)
+	bucket_paths = {}
+
+	def stream_tasks():
+		result_slices = bq_to_df_iter(bq_client, sql_script, slice_row, replace_in_query, log, ignore_error)
+		for new_outfile_name, subset_df in _named_slices(result_slices, slice_row, outfile_name, '.csv'):
+			file_name = f'{new_outfile_name}.gz' if compress else new_outfile_name
+			full_bucket_path = f'{bucket_dir_path.rstrip('/')}/{file_name}' if bucket_dir_path else file_name
+			bucket_paths[file_name] = full_bucket_path
+			yield file_name, (bucket, full_bucket_path, subset_df, content_type, chunk_size, compress, csv_args)
+
+	results = []
+	for file_name, checksums, error, elapsed in _run_slices(_stream_slice, stream_tasks(), workers):
+		full_bucket_path = bucket_paths[file_name]
+		results.append({
+			'file_name': file_name,
+			'bucket_path': full_bucket_path,
+			'status': 'failed' if error else 'uploaded',
+			'error': error,
+			'seconds': elapsed
+		})
+
+		if error:
+			if log:
+				print(f'Failed to stream {file_name} to {bucket_id}/{full_bucket_path}\n{error}')
+			if workers <= 1 and not ignore_error:
+				raise error
+		else:
+			_index_upload(bucket_id, full_bucket_path, checksums)
+			if log:
+				print(f'{datetime.now()} streamed {file_name} to {bucket_id}/{full_bucket_path} ({elapsed:.2f}s)')
+
+	failed = [result for result in results if result['status'] == 'failed']
+	if failed and not ignore_error:
+		failed_names = ', '.join(result['file_name'] for result in failed)
+		raise RuntimeError(f'{len(failed)} of {len(results)} streamed uploads to {bucket_id} failed: {failed_names}') from failed[0]['error']
+
+	return results
+
+# encode one DF slice straight into a resumable upload; returns (md5_hash, crc32c, size) of the uploaded object
+# leaving the blob writer's with block on an error terminates the upload session, so a slice that fails half way
+# never replaces the object; closing the writer does not fetch the object's metadata, hence the reload
+def _stream_slice(bucket, full_bucket_path:str, subset_df, content_type:str, chunk_size:int, compress:bool, csv_args:tuple) -> tuple:
+	blob = bucket.blob(full_bucket_path)
+	with blob.open('wb', chunk_size=chunk_size, content_type=content_type, ignore_flush=True) as blob_writer:
+		if compress:
+			# mtime=0 keeps the gzip output identical across runs for the same data
+			with gzip.GzipFile(fileobj=blob_writer, mode='wb', mtime=0) as gzip_writer:
+				_encode_csv(subset_df, gzip_writer, *csv_args)
+		else:
+			_encode_csv(subset_df, blob_writer, *csv_args)
+
+	blob.reload()
+	return blob.md5_hash, blob.crc32c, blob.size
+
 '''
 File data to BQ (Excel/CSV)
 '''
 
-def file_to_bucket(storage_client, bucket_id:str, bucket_dir_path:str, file_type:str, file_path:str, mode:str, log=False):
+# mode 'i' checks for an existing object against a cached listing of the folder (see bucket_object_index)
+# mode 's' (sync) uploads only new files or files whose checksum differs from the object in the listing
+# a Sync_Manifest skips re-hashing local files that haven't changed since the last sync
+# files of composite_threshold bytes or more are uploaded as composite_part_size parts on composite_workers threads
+def file_to_bucket(storage_client,
+				   bucket_id:str,
+				   bucket_dir_path:str,
+				   file_type:str,
+				   file_path:str,
+				   mode:str,
+				   log=False,
+				   index_ttl:float=BUCKET_INDEX_TTL,
+				   manifest:Sync_Manifest=None,
+				   composite_threshold:int=None,
+				   composite_part_size:int=64*1024**2,
+				   composite_workers:int=8
+):
 	# parse error handling
-	if mode not in ('i', 't'):
-		raise ValueError("Incorrect write mode. Must be 'i' for ignore, or 't' for truncate")
+	if mode not in ('i', 't', 's'):
+		raise ValueError("Incorrect write mode. Must be 'i' for ignore, 't' for truncate or 's' for sync")
 	if file_type not in content_data:
 		raise ValueError(f'Invalid file type. Supported: {list(content_data.keys())}')
 	
@@ -23,6 +400,8 @@ def file_to_bucket(storage_client, bucket_id:str, bucket_dir_path:str, file_type
 		raise ValueError(f'{file_path} not found')
 	if not os.path.isfile(file_path):
 		raise ValueError(f'{file_path} is not a file')
+	if composite_threshold is not None and composite_threshold <= 0:
+		raise ValueError('composite_threshold must be greater than 0 or None (single stream only)')
 
 	# constructing full file path in bucket based on file name and base bucket path
 	# os.path.basename extracts the file name from the full file path
@@ -32,54 +411,126 @@ def file_to_bucket(storage_client, bucket_id:str, bucket_dir_path:str, file_type
 	# upload process
 	try:
 		# create file blob for upload - blob is a binary representation of the file to be uploaded
-		blob = storage_client.bucket(bucket_id).blob(full_bucket_path)
+		bucket = storage_client.bucket(bucket_id)
+		blob = bucket.blob(full_bucket_path)
 
 		# skip upload if in ignore mode and file exists
-		if mode == 'i' and blob.exists():
+		if mode == 'i' and full_bucket_path in bucket_object_index(storage_client, bucket_id, _blob_prefix(full_bucket_path), index_ttl, log):
 			print(f'Skipping file {full_bucket_path} as it already exists.') if log else 0
 			return
 
-		# upload blob
-		blob.upload_from_filename(file_path, content_type=content_data[file_type]['content_type'])
+		# skip upload if in sync mode and the content is unchanged
+		if mode == 's':
+			remote = bucket_object_index(storage_client, bucket_id, _blob_prefix(full_bucket_path), index_ttl, log).get(full_bucket_path)
+			with open(file_path, 'rb') as file:
+				unchanged = _is_unchanged(file, os.path.getsize(file_path), remote, manifest, file_path)
+			if manifest is not None:
+				manifest.save()
+			if unchanged:
+				print(f'Skipping file {full_bucket_path} as it is unchanged.') if log else 0
+				return
+
+		# upload blob - large files as parallel parts, the rest as a single stream
+		if composite_threshold is not None and os.path.getsize(file_path) >= composite_threshold:
+			_composite_upload(bucket, blob, file_path, content_data[file_type]['content_type'], composite_part_size, composite_workers, log)
+		else:
+			blob.upload_from_filename(file_path, content_type=content_data[file_type]['content_type'])
+		_index_upload(bucket_id, full_bucket_path, (blob.md5_hash, blob.crc32c, blob.size))
 		print(f"Uploaded {content_data[file_type]['type_name']} {file_path} to {bucket_dir_path if bucket_dir_path else '/'}") if log else 0
 	except Exception:
 		print(f"Failed to upload {content_data[file_type]['type_name']} {file_path} to {bucket_dir_path if bucket_dir_path else '/'}") if log else 0
 		raise
 
-def bin_file_to_bucket(storage_client, bucket_id:str, bucket_dir_path:str, file_data:List[Tuple], mode:str, log=False):
+# file_data can be a list of (file name, file buffer) pairs or a lazy iterator of them, e.g. from df_to_csv_bin_iter
+# workers > 1 uploads that many files at once through one shared bucket handle; every file is attempted
+# and the failed ones are raised together at the end, unless ignore_error
+# modes 'i' and 's' list each destination folder once (see bucket_object_index) instead of checking every file
+# returns one result per file: {'file_name', 'bucket_path', 'status' ('uploaded', 'skipped', 'unchanged' or 'failed'), 'error', 'seconds'}
+def bin_file_to_bucket(storage_client, bucket_id:str, bucket_dir_path:str, file_data:Iterable[Tuple], mode:str, log=False, workers:int=1, ignore_error:bool=False, index_ttl:float=BUCKET_INDEX_TTL) -> List[dict]:
 	# parse error handling
-	if mode not in ('i', 't'):
-		raise ValueError("Incorrect write mode. Must be 'i' for ignore, or 't' for truncate")
-
-	# file integrity - check file type
-	for file_name, file_buffer in file_data:
-		file_type = os.path.splitext(file_name)[1]
-		if file_type not in content_data:
-			raise ValueError(f'Invalid file type. Supported: {list(content_data.keys())}')
-		
-		# define full file path in Bucket
-		full_bucket_path = f'{bucket_dir_path.rstrip('/')}/{file_name}' if bucket_dir_path else file_name
-
-		# upload process
-		try:
-			# create file blob for upload - blob is a binary representation of the file to be uploaded
-			blob = storage_client.bucket(bucket_id).blob(full_bucket_path)
+	if mode not in ('i', 't', 's'):
+		raise ValueError("Incorrect write mode. Must be 'i' for ignore, 't' for truncate or 's' for sync")
+
+	bucket = storage_client.bucket(bucket_id)
+	dir_label = bucket_dir_path if bucket_dir_path else '/'
+	bucket_paths = {}
+	listings = {}
+
+	def listing(full_bucket_path:str) -> dict:
+		prefix = _blob_prefix(full_bucket_path)
+		if prefix not in listings:
+			listings[prefix] = bucket_object_index(storage_client, bucket_id, prefix, index_ttl, log)
+		return listings[prefix]
 
-			# skip upload if in ignore mode and file exists
-			if mode == 'i' and blob.exists():
-				print(f'Skipping file {full_bucket_path} as it already exists.') if log else 0
-				continue
+	def upload_tasks():
+		# file integrity - check file type
+		for file_name, file_buffer in file_data:
+			file_type = get_file_ext(file_name)
+			if file_type not in content_data:
+				raise ValueError(f'Invalid file type. Supported: {list(content_data.keys())}')
 
-			# upload blob
-			file_buffer.seek(0)
-			blob.upload_from_file(file_buffer, content_type=content_data[file_type]['content_type'])
+			# define full file path in Bucket
+			full_bucket_path = f'{bucket_dir_path.rstrip('/')}/{file_name}' if bucket_dir_path else file_name
+			bucket_paths[file_name] = full_bucket_path
 
+			exists = mode == 'i' and full_bucket_path in listing(full_bucket_path)
+			remote = listing(full_bucket_path).get(full_bucket_path) if mode == 's' else None
+			yield file_name, (bucket, full_bucket_path, file_buffer, file_type, exists, mode == 's', remote)
+
+	results = []
+	for file_name, upload_result, error, elapsed in _run_slices(_upload_buffer, upload_tasks(), workers):
+		status, checksums = upload_result if upload_result else (None, None)
+		type_name = content_data[get_file_ext(file_name)]['type_name']
+		full_bucket_path = bucket_paths[file_name]
+		results.append({
+			'file_name': file_name,
+			'bucket_path': full_bucket_path,
+			'status': 'failed' if error else status,
+			'error': error,
+			'seconds': elapsed
+		})
+
+		if error:
 			if log:
-				print(f"Uploaded {content_data[file_type]['type_name']} {file_name} to {bucket_dir_path if bucket_dir_path else '/'}")
-		except Exception:
+				print(f"Failed to upload {type_name} {file_name} to {dir_label}\n{error}")
+			# one at a time keeps the original fail-fast behaviour
+			if workers <= 1 and not ignore_error:
+				raise error
+		elif status == 'skipped':
+			print(f'Skipping file {full_bucket_path} as it already exists.') if log else 0
+		elif status == 'unchanged':
+			print(f'Skipping file {full_bucket_path} as it is unchanged.') if log else 0
+		else:
+			_index_upload(bucket_id, full_bucket_path, checksums)
 			if log:
-				print(f"Failed to upload {content_data[file_type]['type_name']} {file_name} to {bucket_dir_path if bucket_dir_path else '/'}")
-			raise
+				print(f"Uploaded {type_name} {file_name} to {dir_label} ({elapsed:.2f}s)")
+
+	failed = [result for result in results if result['status'] == 'failed']
+	if failed and not ignore_error:
+		failed_names = ', '.join(result['file_name'] for result in failed)
+		raise RuntimeError(f'{len(failed)} of {len(results)} uploads to {bucket_id} failed: {failed_names}') from failed[0]['error']
+
+	return results
+
+# upload one buffer as a blob; returns (status, (md5_hash, crc32c, size) of the uploaded object)
+# status is 'skipped' if the blob is known to exist already, or 'unchanged' in sync mode if the content matches remote
+def _upload_buffer(bucket, full_bucket_path:str, file_buffer, file_type:str, exists:bool=False, sync:bool=False, remote:tuple=None) -> tuple:
+	if exists:
+		return 'skipped', None
+
+	# hashing runs on the upload worker so concurrent syncs hash in parallel
+	if sync:
+		file_buffer.seek(0, os.SEEK_END)
+		if _is_unchanged(file_buffer, file_buffer.tell(), remote):
+			return 'unchanged', None
+
+	# create file blob for upload - blob is a binary representation of the file to be uploaded
+	blob = bucket.blob(full_bucket_path)
+
+	# upload blob
+	file_buffer.seek(0)
+	blob.upload_from_file(file_buffer, content_type=content_data[file_type]['content_type'])
+	return 'uploaded', (blob.md5_hash, blob.crc32c, blob.size)
 
 def bucket_csv_to_bq(bq_client, bucket_filepath:str, project_id:str, dataset_id:str, table_id:str, write_mode:str, skip_leading_rows:int=1, schema:Optional[List[bq.SchemaField]]=None, log:bool=False) -> None:
 	if write_mode not in ('a', 't'):
@@ -135,3 +586,144 @@ def bucket_excel_to_bq(bq_client, bucket_filepath:str, project_id:str, dataset_i
 	except Exception as error:
 		print(f'Failed to load {bucket_filepath} to {project_id}.{dataset_id}.{table_id}. Error: {error}') if log else ''
 		raise
+
+# BigQuery accepts up to 10,000 source URIs per load job
+BQ_LOAD_MAX_URIS = 10000
+
+# load many bucket files into one table with as few load jobs as possible
+# bucket_filepaths: list of paths without gs://, or one path with a * wildcard, e.g. 'my_bucket/exports/sales_*.csv'
+# files are grouped per format into jobs of up to BQ_LOAD_MAX_URIS URIs (BigQuery expands their wildcards itself)
+# every path is checked before the first job is submitted; Excel files are rejected, BigQuery cannot load them from a bucket
+# with write_mode 't' the first job truncates the table and has to finish before the others append to it
+# returns the load jobs; wait_for_jobs=False returns as soon as they are submitted, see load_jobs_summary
+def bucket_files_to_bq(bq_client,
+					   bucket_filepaths,
+					   project_id:str,
+					   dataset_id:str,
+					   table_id:str,
+					   write_mode:str,
+					   skip_leading_rows:int=1,
+					   schema:Optional[List[bq.SchemaField]]=None,
+					   wait_for_jobs:bool=True,
+					   log:bool=False
+) -> list:
+	if write_mode not in ('a', 't'):
+		raise ValueError("Incorrect write mode. Must be 'a' for append or 't' for truncate.")
+	if isinstance(bucket_filepaths, str):
+		bucket_filepaths = [bucket_filepaths]
+	if any(bucket_filepath.startswith('gs://') for bucket_filepath in bucket_filepaths):
+		raise ValueError("Do not inclide 'gs://' in bucket file path.")
+
+	destination = f'{project_id}.{dataset_id}.{table_id}'
+
+	format_uris = {}	# source format -> URIs
+	for bucket_filepath in bucket_filepaths:
+		format_uris.setdefault(_source_format(bucket_filepath), []).append(f'gs://{bucket_filepath}')
+
+	load_groups = [
+		(source_format, uris[start:start + BQ_LOAD_MAX_URIS])
+		for source_format, uris in format_uris.items()
+		for start in range(0, len(uris), BQ_LOAD_MAX_URIS)
+	]
+	if not load_groups:
+		raise ValueError('No bucket files to load.')
+
+	write_disposition = 'WRITE_TRUNCATE' if write_mode == 't' else 'WRITE_APPEND'
+	jobs = []
+	for source_format, uris in load_groups:
+		job_config = _load_job_config(source_format, write_disposition, skip_leading_rows, schema)
+		try:
+			job = bq_client.load_table_from_uri(uris, destination=destination, job_config=job_config)
+			if log:
+				print(f'{datetime.now()} submitted load job {job.job_id} ({len(uris)} URIs) to {destination}')
+
+			# appends must not start until the truncating job has replaced the table
+			if write_disposition == 'WRITE_TRUNCATE' and len(load_groups) > 1:
+				job.result()
+				write_disposition = 'WRITE_APPEND'
+		except Exception as error:
+			print(f'Failed to load {uris[0]}{" and more" if len(uris) > 1 else ""} to {destination}. Error: {error}') if log else ''
+			raise
+		jobs.append(job)
+
+	if wait_for_jobs:
+		for job in jobs:
+			job.result()
+		if log:
+			summary = load_jobs_summary(jobs)
+			print(f"{datetime.now()} loaded {summary['input_files']} files ({summary['output_rows']} rows, {summary['output_bytes']} bytes) to {destination} in {summary['jobs']} jobs")
+
+	return jobs
+
+# load one bucket file of any format with a source_format in formats.content_data, e.g. .parquet, .avro, .csv.gz
+# returns the finished load job
+def bucket_file_to_bq(bq_client, bucket_filepath:str, project_id:str, dataset_id:str, table_id:str, write_mode:str, skip_leading_rows:int=1, schema:Optional[List[bq.SchemaField]]=None, log:bool=False):
+	if write_mode not in ('a', 't'):
+		raise ValueError("Incorrect write mode. Must be 'a' for append or 't' for truncate.")
+	if bucket_filepath.startswith('gs://'):
+		raise ValueError("Do not inclide 'gs://' in bucket file path.")
+
+	write_disposition = 'WRITE_TRUNCATE' if write_mode == 't' else 'WRITE_APPEND'
+	job_config = _load_job_config(_source_format(bucket_filepath), write_disposition, skip_leading_rows, schema)
+	destination = f'{project_id}.{dataset_id}.{table_id}'
+
+	try:
+		job = bq_client.load_table_from_uri(f'gs://{bucket_filepath}', destination=destination, job_config=job_config)
+		job.result()
+		print(f'Successfully loaded {bucket_filepath} to {destination}') if log else ''
+	except Exception as error:
+		print(f'Failed to load {bucket_filepath} to {destination}. Error: {error}') if log else ''
+		raise
+
+	return job
+
+# BigQuery source format of a bucket file, from its extension
+def _source_format(bucket_filepath:str) -> str:
+	file_type = get_file_ext(bucket_filepath)
+	if file_type == '.xlsx':
+		raise ValueError(f'{bucket_filepath}: BigQuery cannot load Excel files from a bucket. Read the file into a DataFrame and load it with df_to_bq.')
+
+	source_format = content_data.get(file_type, {}).get('source_format')
+	if source_format is None:
+		loadable = [file_type for file_type, file_data in content_data.items() if file_data.get('source_format')]
+		raise ValueError(f'Invalid file type for {bucket_filepath}. Supported: {loadable}')
+	return source_format
+
+# load job config for one source format
+# CSV schemas are autodetected unless given; Parquet and Avro carry their own schema
+def _load_job_config(source_format:str, write_disposition:str, skip_leading_rows:int=1, schema:Optional[List[bq.SchemaField]]=None):
+	job_config = bq.LoadJobConfig(
+		source_format=source_format,
+		write_disposition=write_disposition,
+		schema=schema
+	)
+	if source_format not in (bq.SourceFormat.PARQUET, bq.SourceFormat.AVRO):
+		job_config.autodetect = not schema
+	if source_format == bq.SourceFormat.CSV:
+		job_config.skip_leading_rows = skip_leading_rows
+	elif source_format == bq.SourceFormat.AVRO:
+		# load timestamp-micros fields as TIMESTAMP instead of INTEGER
+		job_config.use_avro_logical_types = True
+	return job_config
+
+# combined statistics of load jobs, e.g. from bucket_files_to_bq(wait_for_jobs=False); jobs still running are counted as pending
+def load_jobs_summary(jobs:list) -> dict:
+	summary = {'jobs': len(jobs), 'done': 0, 'pending': 0, 'failed': 0, 'input_files': 0, 'input_file_bytes': 0, 'output_rows': 0, 'output_bytes': 0, 'errors': []}
+	for job in jobs:
+		# done() reloads the job state from BigQuery
+		if not job.done():
+			summary['pending'] += 1
+			continue
+
+		summary['done'] += 1
+		if job.error_result:
+			summary['failed'] += 1
+			summary['errors'].append(f"{job.job_id}: {job.error_result.get('message')}")
+			continue
+
+		summary['input_files'] += job.input_files or 0
+		summary['input_file_bytes'] += job.input_file_bytes or 0
+		summary['output_rows'] += job.output_rows or 0
+		summary['output_bytes'] += job.output_bytes or 0
+
+	return summary
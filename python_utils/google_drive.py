@@ -1,13 +1,42 @@
 import os
+import json
+import time
+import random
+import hashlib
 import openpyxl
+import threading
+import pandas as pd
 from io import BytesIO
+from tempfile import SpooledTemporaryFile
+from contextlib import nullcontext
 from datetime import datetime
 from google.oauth2 import service_account
 from googleapiclient.discovery import build, Resource
 from googleapiclient.http import MediaIoBaseUpload, MediaIoBaseDownload
-from typing import List, Tuple
+from typing import Iterable, Iterator, List, Tuple
 from python_utils.formats import content_data
 from python_utils.utils import *
+from python_utils.utils import _run_slices
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+
+# resolved folders (parent id + name -> folder data) are reused for this many seconds
+FOLDER_CACHE_TTL = 300
+
+# folder listings used to find duplicates on upload (update_dup) are reused for this many seconds
+FOLDER_INDEX_TTL = 60
+
+# bytes per download request; one chunk per download is held in memory at a time
+DOWNLOAD_CHUNK_SIZE = 32 * 1024**2
+
+# bytes per resumable upload request, a multiple of 256 KiB as Drive requires
+UPLOAD_CHUNK_SIZE = 32 * 1024**2
+
+# files().list and changes().list page size; 1000 is the most Drive returns per page
+LIST_PAGE_SIZE = 1000
+
+# file fields kept in a Drive_Index; id, name, mimeType and parents are always requested
+TREE_FIELDS = 'id, name, mimeType, parents, modifiedTime, size, md5Checksum'
 
 '''
 Credentials
@@ -20,13 +49,242 @@ def build_drive_service(service_account_key) -> Resource:
 	service = build('drive', 'v3', credentials=creds)
 	return service
 
+'''
+Rate limiting
+'''
+
+# adaptive token bucket shared by the upload workers of one batch
+# acquire() blocks until the next request may be sent
+# rate_limited() cuts the rate by `decrease` (at most once per cooldown, since in-flight requests fail together)
+# success() grows the rate like TCP: it doubles every second until the first rate limit error (slow start),
+# then climbs by about `increase` requests/s for every second without errors
+class Rate_Limiter:
+	def __init__(self, rate:float=10.0, min_rate:float=0.5, max_rate:float=100.0, burst:float=None, increase:float=1.0, decrease:float=0.5, cooldown:float=1.0):
+		if not 0 < min_rate <= rate <= max_rate:
+			raise ValueError('Invalid rates. Must be 0 < min_rate <= rate <= max_rate')
+
+		self.rate = rate
+		self.min_rate = min_rate
+		self.max_rate = max_rate
+		self.burst = burst or max(1.0, rate)
+		self.increase = increase
+		self.decrease = decrease
+		self.cooldown = cooldown
+		self.throttled = 0
+		self._tokens = self.burst
+		self._updated = time.monotonic()
+		self._throttled_at = None
+		self._lock = threading.Lock()
+
+	def acquire(self):
+		while True:
+			with self._lock:
+				self._refill()
+				if self._tokens >= 1:
+					self._tokens -= 1
+					return
+				wait_seconds = (1 - self._tokens) / self.rate
+			time.sleep(wait_seconds)
+
+	def success(self):
+		with self._lock:
+			self._refill()
+			step = 1.0 if self._throttled_at is None else self.increase / self.rate
+			self.rate = min(self.max_rate, self.rate + step)
+
+	def rate_limited(self):
+		with self._lock:
+			self._refill()
+			self.throttled += 1
+			now = time.monotonic()
+			if self._throttled_at is not None and now - self._throttled_at < self.cooldown:
+				return
+			self._throttled_at = now
+			self.rate = max(self.min_rate, self.rate * self.decrease)
+			# drop the saved up burst so the next requests are paced at the new rate
+			self._tokens = min(self._tokens, 0.0)
+
+	def _refill(self):
+		now = time.monotonic()
+		self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+		self._updated = now
+
+	def __repr__(self):
+		return f'Rate_Limiter(rate={self.rate:.2f}/s, throttled={self.throttled})'
+
+'''
+Resumable uploads
+'''
+
+# resumable upload session URIs saved as JSON, keyed by absolute file path, so a restarted job continues an upload
+# instead of starting over; an entry is only reused for the same target and while the file's size and mtime are unchanged
+# every change is written straight away (temp file + rename), since the point is to survive the process dying
+class Upload_Sessions:
+	def __init__(self, path:str):
+		self.path = path
+		self.entries = {}
+		self._lock = threading.Lock()
+
+		if os.path.exists(path):
+			with open(path, 'r') as sessions_file:
+				self.entries = json.load(sessions_file)
+
+	# saved session URI for uploading file_path to target, or None
+	def get(self, file_path:str, target:str) -> str:
+		stat = os.stat(file_path)
+		with self._lock:
+			entry = self.entries.get(os.path.abspath(file_path))
+		if entry and entry['target'] == target and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+			return entry['session_uri']
+		return None
+
+	def put(self, file_path:str, target:str, session_uri:str):
+		stat = os.stat(file_path)
+		with self._lock:
+			self.entries[os.path.abspath(file_path)] = {'target': target, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'session_uri': session_uri}
+			self._save()
+
+	def drop(self, file_path:str):
+		with self._lock:
+			if self.entries.pop(os.path.abspath(file_path), None) is not None:
+				self._save()
+
+	def _save(self):
+		tmp_path = f'{self.path}.{os.getpid()}.tmp'
+		with open(tmp_path, 'w') as sessions_file:
+			json.dump(self.entries, sessions_file)
+		os.replace(tmp_path, self.path)
+
+'''
+Folder tree index
+'''
+
+# local copy of the metadata of every file below a Drive folder, saved as JSON (temp file + rename)
+# files: {file id: file data + 'path' relative to the root folder}
+# start_page_token: where the next changes feed starts, see Google_Drive.drive_sync_index
+class Drive_Index:
+	def __init__(self, path:str=None):
+		self.path = path
+		self.root_id = None
+		self.start_page_token = None
+		self.files = {}
+
+		if path and os.path.exists(path):
+			with open(path, 'r') as index_file:
+				saved = json.load(index_file)
+			self.root_id = saved['root_id']
+			self.start_page_token = saved['start_page_token']
+			self.files = saved['files']
+
+	def save(self):
+		if not self.path:
+			return
+		tmp_path = f'{self.path}.{os.getpid()}.tmp'
+		with open(tmp_path, 'w') as index_file:
+			json.dump({'root_id': self.root_id, 'start_page_token': self.start_page_token, 'files': self.files}, index_file)
+		os.replace(tmp_path, self.path)
+
+	# {path: file data}
+	def by_path(self) -> dict:
+		return {drive_file['path']: drive_file for drive_file in self.files.values()}
+
+	def children(self, folder_id:str) -> list:
+		return [drive_file for drive_file in self.files.values() if folder_id in drive_file.get('parents', [])]
+
+	# apply changes().list entries in the order Drive returned them
+	# removed/trashed files and files moved out of the tree are dropped along with everything below them;
+	# renamed or moved folders take their subtree's paths with them
+	# returns {'updated', 'removed', 'new_folders'}: folders that just entered the tree, whose contents the feed
+	# does not list and which need walking
+	def apply_changes(self, changes:list) -> dict:
+		updated, removed, new_folders = 0, 0, []
+		for change in changes:
+			if change.get('changeType', 'file') != 'file':
+				continue
+
+			file_id = change['fileId']
+			drive_file = change.get('file')
+			parent_id = next((parent_id for parent_id in (drive_file or {}).get('parents', []) if parent_id == self.root_id or parent_id in self.files), None)
+			if change.get('removed') or not drive_file or drive_file.get('trashed') or parent_id is None:
+				removed += self._drop_subtree(file_id)
+				continue
+
+			drive_file = {key: value for key, value in drive_file.items() if key != 'trashed'}
+			parent_path = self.files[parent_id]['path'] if parent_id != self.root_id else ''
+			drive_file['path'] = f"{parent_path}/{drive_file['name']}" if parent_path else drive_file['name']
+
+			previous = self.files.get(file_id)
+			self.files[file_id] = drive_file
+			updated += 1
+
+			if drive_file['mimeType'] == FOLDER_MIME_TYPE:
+				if previous is None:
+					new_folders.append(file_id)
+				elif previous['path'] != drive_file['path']:
+					self._repath_subtree(file_id)
+
+		# a later change in the feed can drop a new folder again, e.g. when its parent is trashed
+		new_folders = [folder_id for folder_id in new_folders if folder_id in self.files]
+		return {'updated': updated, 'removed': removed, 'new_folders': new_folders}
+
+	# ids of everything below folder_id
+	def _subtree(self, folder_id:str) -> list:
+		children = {}
+		for drive_file in self.files.values():
+			for parent_id in drive_file.get('parents', []):
+				children.setdefault(parent_id, []).append(drive_file['id'])
+
+		subtree, level = [], [folder_id]
+		while level:
+			level = [child_id for cur_id in level for child_id in children.get(cur_id, [])]
+			subtree.extend(level)
+		return subtree
+
+	def _drop_subtree(self, file_id:str) -> int:
+		if file_id not in self.files:
+			return 0
+		dropped = [file_id] + self._subtree(file_id)
+		for dropped_id in dropped:
+			self.files.pop(dropped_id, None)
+		return len(dropped)
+
+	def _repath_subtree(self, folder_id:str):
+		for file_id in self._subtree(folder_id):
+			drive_file = self.files[file_id]
+			drive_file['path'] = f"{self.files[drive_file['parents'][0]]['path']}/{drive_file['name']}"
+
+# Drive answers rate limiting with 429, or with 403 and a rateLimitExceeded / userRateLimitExceeded reason
+def _is_rate_limited(error) -> bool:
+	status = getattr(getattr(error, 'resp', None), 'status', None)
+	if status == 429:
+		return True
+	if status == 403:
+		content = getattr(error, 'content', b'') or b''
+		return b'RateLimitExceeded' in content or b'rateLimitExceeded' in content
+	return False
+
+# server errors worth retrying
+def _is_transient(error) -> bool:
+	status = getattr(getattr(error, 'resp', None), 'status', None)
+	return status in (500, 502, 503, 504)
+
 class Google_Drive:
-	def __init__(self, service, is_shared_drive:str, main_drive_id:str=None):
+	# service_account_key lets concurrent uploads build one service per worker thread,
+	# since a service object shares one httplib2 connection and is not thread-safe
+	def __init__(self, service, is_shared_drive:str, main_drive_id:str=None, folder_cache_ttl:float=FOLDER_CACHE_TTL, service_account_key:str=None):
 		if not isinstance(is_shared_drive, bool):
 			raise ValueError('is_shared_drive must be type <bool>')
 		
 		self.service = service
 		self.is_shared_drive = is_shared_drive
+		self.service_factory = (lambda: build_drive_service(service_account_key)) if service_account_key else None
+		self._thread_local = threading.local()
+		self.folder_cache_ttl = folder_cache_ttl
+		self._folder_cache = {}	# (parent folder id, folder name) -> (cached at, folder data)
+		self._folder_cache_lock = threading.Lock()
+		self._folder_index = {}	# folder id -> (listed at, {file name: [file data, newest first]})
+		self._folder_index_lock = threading.Lock()
+		self._download_paths_lock = threading.Lock()	# guards the claimed paths of drive_download_batch
 		if not is_shared_drive:
 			# set drive_id = 'root' if working on My Drive 
 			if main_drive_id in ['my-drive', None] :
@@ -44,37 +302,93 @@ class Google_Drive:
 	def drive_get_dup_files(self, dst_folder_id:str, file_name:str, log:bool=False) -> list:
 		query = f"""
 		'{dst_folder_id}' in parents
-		and name='{file_name}'
+		and name='{_escape_query(file_name)}'
 		and trashed=false
 		"""
 
 		try:
-			results = self.service.files().list(
-					q=query,
-					fields='files(id, name)',
-					supportsAllDrives=self.is_shared_drive,
-					includeItemsFromAllDrives=self.is_shared_drive
-			).execute()
+			dup_files = list(self._list_files(query, 'id, name'))
 		except Exception as error:
 			if log:
 				print(f'Unable to read folder Id {dst_folder_id}\n{error}')
 			raise
 
-		# get dup file id
-		dup_files = results.get('files', [])
-
 		return dup_files
 
+	# yield every file matching query, following nextPageToken
+	# fields is the mask for one file, e.g. 'id, name'; Drive can return a short or empty page before the last one,
+	# so only a missing nextPageToken ends the listing
+	def _list_files(self, query:str, fields:str, order_by:str=None, page_size:int=LIST_PAGE_SIZE, service=None) -> Iterator[dict]:
+		page_token = None
+		while True:
+			results = (service or self.service).files().list(
+				q=query,
+				fields=f'nextPageToken, files({fields})',
+				orderBy=order_by,
+				pageSize=page_size,
+				pageToken=page_token,
+				supportsAllDrives=self.is_shared_drive,
+				includeItemsFromAllDrives=self.is_shared_drive
+			).execute()
+
+			yield from results.get('files', [])
+			page_token = results.get('nextPageToken')
+			if not page_token:
+				return
+
+	# {file name: [file data, newest first]} for everything directly in folder_id, following nextPageToken
+	# the listing is reused for ttl seconds and kept up to date by the uploads of this object, so a batch
+	# of uploads into one folder costs one listing instead of one duplicate lookup per file
+	# worker threads pass their own service (see _thread_service)
+	def drive_folder_index(self, folder_id:str, ttl:float=FOLDER_INDEX_TTL, log:bool=False, service=None) -> dict:
+		with self._folder_index_lock:
+			indexed = self._folder_index.get(folder_id)
+			if indexed and time.monotonic() - indexed[0] <= ttl:
+				return indexed[1]
+
+		query = f"'{folder_id}' in parents and trashed=false"
+		children = {}
+		try:
+			for drive_file in self._list_files(query, 'id, name, mimeType, modifiedTime', order_by='modifiedTime desc', service=service):
+				children.setdefault(drive_file['name'], []).append(drive_file)
+		except Exception as error:
+			if log:
+				print(f'Unable to list folder Id {folder_id}\n{error}')
+			raise
+
+		if log:
+			print(f'{datetime.now()} indexed {sum(len(files) for files in children.values())} files in folder Id {folder_id}')
+
+		with self._folder_index_lock:
+			self._folder_index[folder_id] = (time.monotonic(), children)
+		return children
+
+	# drop the listing of one folder, or of every folder
+	def invalidate_folder_index(self, folder_id:str=None):
+		with self._folder_index_lock:
+			if folder_id is None:
+				self._folder_index.clear()
+			else:
+				self._folder_index.pop(folder_id, None)
+
+	# record a file created by this object in the listings of its parent folders
+	def _index_created(self, drive_file:dict, parents:list):
+		with self._folder_index_lock:
+			for folder_id in parents:
+				if folder_id in self._folder_index:
+					self._folder_index[folder_id][1].setdefault(drive_file['name'], []).insert(0, drive_file)
+
 	# create/upload a new file in Google Drive
 	# allow duplicates
-	def drive_create_file(self, file_metadata:dict, media, log:bool=False):
+	# returns the created file data: {'id', 'name'}
+	def drive_create_file(self, file_metadata:dict, media, log:bool=False, service=None) -> dict:
 		if log:
 			print(f"{datetime.now()} Creating {file_metadata['name']}")
 		try:
-			self.service.files().create(
+			drive_file = (service or self.service).files().create(
 				body=file_metadata,
 				media_body=media,
-				fields='id',
+				fields='id, name',
 				supportsAllDrives=self.is_shared_drive
 			).execute()
 		except Exception as error:
@@ -82,15 +396,19 @@ class Google_Drive:
 				print(f"Error processing: {file_metadata['name']}\n{error}")
 			raise
 
+		drive_file.setdefault('name', file_metadata['name'])
+		self._index_created(drive_file, file_metadata.get('parents', []))
+		return drive_file
+
 	# update file in Drive if the file being uploaded alr exists
 	# truncate duplicate files
-	def drive_update_file(self, media, dup_files:list, log:bool=False):
+	def drive_update_file(self, media, dup_files:list, log:bool=False, service=None):
 		if log:
 			print(f"{datetime.now()} Updating {dup_files[0]['name']}")
 
 		dup_file_id = dup_files[0]['id']
 		try:
-			self.service.files().update(
+			(service or self.service).files().update(
 				fileId=dup_file_id,
 				media_body=media,
 				supportsAllDrives=self.is_shared_drive
@@ -107,37 +425,34 @@ class Google_Drive:
 	# look for folder by folder name - user can choose to create folder if it does not exist yet
 	# parent_folder_id = folder id before the target folder
 	# return (folder_id, folder_name and last_modified)
+	# found and created folders are cached for folder_cache_ttl seconds, so repeated lookups cost no API calls
 	def drive_autodetect_folders(self, parent_folder_id:str, folder_name:str, create_folder:bool, log:bool=False) -> list:
+		cached_folder = self._cached_folder(parent_folder_id, folder_name)
+		if cached_folder:
+			return cached_folder
+
 		query = f"""
 		'{parent_folder_id}' in parents
-		and name='{folder_name}'
-		and mimeType='application/vnd.google-apps.folder' 
+		and name='{_escape_query(folder_name)}'
+		and mimeType='{FOLDER_MIME_TYPE}' 
 		and trashed=false
 		"""
 
 		try:
-			# execute the query
-			results = self.service.files().list(
-				q=query,
-				fields='files(id, name, modifiedTime)',
-				orderBy='modifiedTime desc',
-				pageSize=1,
-				supportsAllDrives=self.is_shared_drive,
-				includeItemsFromAllDrives=self.is_shared_drive
-			).execute()
+			# execute the query - newest match only
+			found_folder = next(self._list_files(query, 'id, name, modifiedTime', order_by='modifiedTime desc', page_size=1), None)
 		except Exception as error:
 			if log:
 				print(f"Unable to autodetect '{folder_name}' in folder Id '{parent_folder_id}\n{error}'")
 			raise
 
-		folders_in_drive = results.get('files', []) # files_in_drive = results.get('files', [])
-
-		if folders_in_drive:
-			return folders_in_drive[0]
-		elif not folders_in_drive and create_folder:
+		if found_folder:
+			self._cache_folder(parent_folder_id, folder_name, found_folder)
+			return found_folder
+		elif create_folder:
 			folder_metadata = {
 				'name': folder_name,
-				'mimeType': 'application/vnd.google-apps.folder',
+				'mimeType': FOLDER_MIME_TYPE,
 				'parents': [parent_folder_id]
 			}
 
@@ -153,51 +468,197 @@ class Google_Drive:
 					print(f"Unable to create '{folder_name}' in folder Id '{parent_folder_id}'")
 				raise
 
+			# the new folder replaces whatever was cached for this name
+			self.invalidate_folder_cache(parent_folder_id, folder_name)
+			self._cache_folder(parent_folder_id, folder_name, folder)
+			self._index_created(folder, [parent_folder_id])
 			return folder
 
 		return []
 
+	# resolve a nested folder path such as 'reports/2026/W42' to its folder id, one level at a time
+	# missing levels are created if create_folder, otherwise None is returned
+	# parent_folder_id defaults to the main drive; every resolved level is cached (see drive_autodetect_folders)
+	def drive_resolve_path(self, folder_path:str, parent_folder_id:str=None, create_folder:bool=True, log:bool=False) -> str:
+		folder_id = parent_folder_id or self.main_drive_id
+		for folder_name in (level for level in folder_path.split('/') if level):
+			folder = self.drive_autodetect_folders(folder_id, folder_name, create_folder, log)
+			if not folder:
+				if log:
+					print(f"{datetime.now()} '{folder_name}' not found in folder Id '{folder_id}'")
+				return None
+			folder_id = folder['id']
+
+		return folder_id
+
+	# drop cached folders: one name in one parent, every name in one parent, or everything
+	def invalidate_folder_cache(self, parent_folder_id:str=None, folder_name:str=None):
+		with self._folder_cache_lock:
+			if parent_folder_id is None:
+				self._folder_cache.clear()
+			elif folder_name is not None:
+				self._folder_cache.pop((parent_folder_id, folder_name), None)
+			else:
+				for cache_key in [cache_key for cache_key in self._folder_cache if cache_key[0] == parent_folder_id]:
+					del self._folder_cache[cache_key]
+
+	def _cached_folder(self, parent_folder_id:str, folder_name:str) -> dict:
+		with self._folder_cache_lock:
+			cached = self._folder_cache.get((parent_folder_id, folder_name))
+			if cached is None:
+				return None
+			cached_at, folder = cached
+			if time.monotonic() - cached_at > self.folder_cache_ttl:
+				del self._folder_cache[(parent_folder_id, folder_name)]
+				return None
+			return folder
+
+	def _cache_folder(self, parent_folder_id:str, folder_name:str, folder:dict):
+		if self.folder_cache_ttl > 0:
+			with self._folder_cache_lock:
+				self._folder_cache[(parent_folder_id, folder_name)] = (time.monotonic(), folder)
+
 	# search a file by name in Google Drive
 	# return (file_id, file_name, last_modified)
 	def drive_search_filename(self, parent_folder_id: str, file_name:str) -> List[Tuple]:
 		query = f"""
 		'{parent_folder_id}' in parents
-		and name = '{file_name}'
+		and name = '{_escape_query(file_name)}'
 		and trashed=false
 		"""
 		
 		try:
-			response = self.service.files().list(
-				q=query,
-				fields='files(id, name, modifiedTime)',
-				orderBy='modifiedTime desc',
-				pageSize=1,
-				supportsAllDrives=self.is_shared_drive,
-				includeItemsFromAllDrives=self.is_shared_drive,
-			).execute()
-			
-			files = response.get('files', [])
-			if files:
-				return files[0]
-			else:
-				return []
-				
+			found_file = next(self._list_files(query, 'id, name, modifiedTime', order_by='modifiedTime desc', page_size=1), None)
+			return found_file or []
 		except Exception as error:
 			return []
 
+	# ===============
+	# = Folder tree =
+	# ===============
+
+	# list everything below root_folder_id (default: the main drive) breadth-first
+	# the folders of one level are listed concurrently by `workers` threads, each through its own service
+	# (see drive_upload_batch); without a service_factory there is only the one service, so folders are listed in turn
+	# the pages of one folder are always fetched in turn, since each needs the previous token
+	# fields is the per-file mask; returns {file id: file data + 'path' relative to the root}
+	def drive_walk_tree(self, root_folder_id:str=None, workers:int=4, fields:str=TREE_FIELDS, log:bool=False) -> dict:
+		return self._walk_folders([(root_folder_id or self.main_drive_id, '')], workers, fields, log)
+
+	def _walk_folders(self, folders:list, workers:int, fields:str, log:bool) -> dict:
+		if self.service_factory is None:
+			workers = 1
+		fields = _fields_mask(fields, ['id', 'name', 'mimeType', 'parents'])
+
+		tree = {}
+		folder_paths = dict(folders)
+		level = [folder_id for folder_id, _ in folders]
+		depth = 0
+		while level:
+			list_tasks = ((folder_id, (folder_id, fields)) for folder_id in level)
+			level = []
+			for folder_id, children, error, _ in _run_slices(self._list_children, list_tasks, workers):
+				if error:
+					if log:
+						print(f'Unable to list folder Id {folder_id}\n{error}')
+					raise error
+
+				for drive_file in children:
+					parent_path = folder_paths[folder_id]
+					drive_file['path'] = f"{parent_path}/{drive_file['name']}" if parent_path else drive_file['name']
+					tree[drive_file['id']] = drive_file
+					if drive_file['mimeType'] == FOLDER_MIME_TYPE and drive_file['id'] not in folder_paths:
+						folder_paths[drive_file['id']] = drive_file['path']
+						level.append(drive_file['id'])
+
+			depth += 1
+			if log:
+				print(f'{datetime.now()} listed level {depth}: {len(tree)} files so far, {len(level)} folders next')
+
+		return tree
+
+	def _list_children(self, folder_id:str, fields:str) -> list:
+		return list(self._list_files(f"'{folder_id}' in parents and trashed=false", fields, service=self._thread_service()))
+
+	# token for the changes feed as of now
+	def drive_start_page_token(self) -> str:
+		return self.service.changes().getStartPageToken(
+			supportsAllDrives=self.is_shared_drive,
+			driveId=self.main_drive_id if self.is_shared_drive else None
+		).execute()['startPageToken']
+
+	# every change since page_token, following nextPageToken
+	# returns (changes, token for the next call); fields is the per-file mask, as in drive_walk_tree
+	def drive_changes(self, page_token:str, fields:str=TREE_FIELDS, log:bool=False) -> Tuple[list, str]:
+		fields = _fields_mask(fields, ['id', 'name', 'mimeType', 'parents', 'trashed'])
+		changes = []
+		while True:
+			try:
+				results = self.service.changes().list(
+					pageToken=page_token,
+					fields=f'nextPageToken, newStartPageToken, changes(changeType, removed, fileId, file({fields}))',
+					pageSize=LIST_PAGE_SIZE,
+					includeRemoved=True,
+					supportsAllDrives=self.is_shared_drive,
+					includeItemsFromAllDrives=self.is_shared_drive,
+					driveId=self.main_drive_id if self.is_shared_drive else None
+				).execute()
+			except Exception as error:
+				if log:
+					print(f'Unable to read changes from page token {page_token}\n{error}')
+				raise
+
+			changes.extend(results.get('changes', []))
+			if 'newStartPageToken' in results:
+				return changes, results['newStartPageToken']
+			page_token = results['nextPageToken']
+
+	# bring index up to date with the tree below root_folder_id (default: the main drive)
+	# the first sync (or full=True, or a new root) walks the whole tree; later syncs only read the changes feed
+	# since the saved start page token and walk the folders that moved into the tree
+	# the token is taken before walking, so nothing changed during the walk is missed; the index is saved at the end
+	# returns {'mode': 'full' or 'incremental', 'changes', 'updated', 'removed', 'files'}
+	def drive_sync_index(self, index:Drive_Index, root_folder_id:str=None, full:bool=False, workers:int=4, fields:str=TREE_FIELDS, log:bool=False) -> dict:
+		root_folder_id = root_folder_id or self.main_drive_id
+
+		if full or index.start_page_token is None or index.root_id != root_folder_id:
+			start_page_token = self.drive_start_page_token()
+			index.files = self.drive_walk_tree(root_folder_id, workers, fields, log)
+			index.root_id = root_folder_id
+			index.start_page_token = start_page_token
+			index.save()
+			summary = {'mode': 'full', 'changes': 0, 'updated': len(index.files), 'removed': 0, 'files': len(index.files)}
+		else:
+			changes, start_page_token = self.drive_changes(index.start_page_token, fields, log)
+			applied = index.apply_changes(changes)
+			if applied['new_folders']:
+				index.files.update(self._walk_folders([(folder_id, index.files[folder_id]['path']) for folder_id in applied['new_folders']], workers, fields, log))
+			index.start_page_token = start_page_token
+			index.save()
+			summary = {'mode': 'incremental', 'changes': len(changes), 'updated': applied['updated'], 'removed': applied['removed'], 'files': len(index.files)}
+
+		if log:
+			print(f"{datetime.now()} {summary['mode']} sync of folder Id {root_folder_id}: {summary['files']} files indexed")
+		return summary
+
 	# ===============
 	# = File upload = 
 	# ===============
 
 	# uploads a locally stored file to Google Drive
-	def local_file_to_drive(self, dst_folder_id:str, file_path:str, update_dup=True, log=False):
+	# update_dup finds duplicates through drive_folder_index, listed at most once every index_ttl seconds
+	# the file is streamed in binary, chunk_size bytes per request; progress_callback(file name, bytes sent, total bytes)
+	# runs after every chunk; with resume_path, the upload session is saved there so a restarted job continues it
+	def local_file_to_drive(self, dst_folder_id:str, file_path:str, update_dup=True, log=False, index_ttl:float=FOLDER_INDEX_TTL, chunk_size:int=UPLOAD_CHUNK_SIZE, progress_callback=None, resume_path:str=None) -> dict:
 		# parse error handling
 		if not isinstance(update_dup, bool):
 			raise ValueError('Update dup must be value type <bool>')
+		if chunk_size <= 0 or chunk_size % (256 * 1024):
+			raise ValueError('Invalid chunk size. Must be a multiple of 256 KiB.')
 		
 		# file integrity
 		file_name = os.path.basename(file_path)
-		file_ext = os.path.splitext(file_name)[1]
+		file_ext = get_file_ext(file_name)
 
 		if file_ext not in content_data:
 			raise ValueError(f'Invalid file type. Supported: {list(content_data.keys())}')	
@@ -211,88 +672,515 @@ class Google_Drive:
 			'driveId': self.main_drive_id
 		}
 
-		# determine mimetype and read mode
+		# determine mimetype - the upload always reads bytes, so text files need no special mode
+		# text types are sniffed with a bounded read: a file that isn't utf-8 is sent as raw bytes
+		# so Drive doesn't decode it as text for previews and conversions
 		mime_type = content_data[file_ext]['content_type']
-		mode = 'r' if is_plain_text_file(file_path) else 'rb'
+		if mime_type.startswith('text/') and not is_plain_text_file(file_path):
+			print(f'{file_path} is not utf-8 text, uploading as application/octet-stream') if log else 0
+			mime_type = 'application/octet-stream'
+		sessions = Upload_Sessions(resume_path) if resume_path else None
 
 		# upload process
 		try:
-			with open(file_path, mode) as file:
+			with open(file_path, 'rb') as file:
 				media = MediaIoBaseUpload(
 					file,
 					mimetype=mime_type,
+					chunksize=chunk_size,
 					resumable=True
 				)
 
+				# update existing files or create new ones
+				dup_files = self.drive_folder_index(dst_folder_id, index_ttl, log).get(file_name, []) if update_dup else []
+				return self._upload_media(file_path, file_metadata, media, dup_files, progress_callback, sessions, log)
+		except Exception as error:
+			print(f'Upload failed for {file_path}\n{error}') if log else 0
+			raise
+
+	# send a resumable upload one chunk at a time: creates a file, or updates dup_files[0] if there is one
+	# returns the file data: {'id', 'name'}
+	def _upload_media(self, file_path:str, file_metadata:dict, media, dup_files:list, progress_callback=None, sessions:Upload_Sessions=None, log:bool=False) -> dict:
+		file_name = file_metadata['name']
+		target = f"update:{dup_files[0]['id']}" if dup_files else f"create:{file_metadata['parents'][0]}"
+
+		def new_request():
+			if dup_files:
+				return self.service.files().update(fileId=dup_files[0]['id'], media_body=media, fields='id, name', supportsAllDrives=self.is_shared_drive)
+			return self.service.files().create(body=file_metadata, media_body=media, fields='id, name', supportsAllDrives=self.is_shared_drive)
+
+		if log:
+			print(f"{datetime.now()} {'Updating' if dup_files else 'Creating'} {file_name}")
+
+		request = new_request()
+		session_uri = sessions.get(file_path, target) if sessions else None
+		if session_uri:
+			# the client has no public way to resume a saved session: in the error state, its next chunk
+			# first asks Drive how many bytes of the session arrived and carries on from there
+			request.resumable_uri = session_uri
+			request._in_error_state = True
+			if log:
+				print(f'{datetime.now()} resuming upload session for {file_name}')
+
+		response = None
+		while response is None:
+			try:
+				progress, response = request.next_chunk(num_retries=3)
+			except Exception as error:
+				# the saved session expired (Drive keeps them for a week): start a new one
+				if session_uri and getattr(getattr(error, 'resp', None), 'status', None) in (404, 410):
+					if log:
+						print(f'{datetime.now()} upload session for {file_name} expired, starting over')
+					sessions.drop(file_path)
+					session_uri = None
+					request = new_request()
+					continue
+				raise
+
+			if sessions and request.resumable_uri and request.resumable_uri != session_uri:
+				session_uri = request.resumable_uri
+				sessions.put(file_path, target, session_uri)
+			if progress and progress_callback:
+				progress_callback(file_name, progress.resumable_progress, progress.total_size)
+
+		if sessions:
+			sessions.drop(file_path)
+		if progress_callback:
+			progress_callback(file_name, media.size(), media.size())
+
+		response.setdefault('name', file_name)
+		if not dup_files:
+			self._index_created(response, file_metadata.get('parents', []))
+		return response
+
+	# uploads a binary file data to Google Drive
+	# file data taken in the form of tuple: (file name, file buffer, file type)
+	# or an iterable of (file name, file buffer) / (file name, file buffer, file type) tuples,
+	# e.g. the list from df_to_csv_bin or the lazy iterator from df_to_csv_bin_iter
+	# update_dup lists the destination folder once for the whole batch instead of one lookup per file
+	def bin_file_to_drive(self, dst_folder_id:str, file_data:Iterable[Tuple], update_dup=True, log=False, index_ttl:float=FOLDER_INDEX_TTL):
+		# parsing check
+		if update_dup not in (True, False):
+			raise ValueError('Update dup must be value type <bool>')
+
+		# a single (file name, file buffer, file type) tuple
+		if isinstance(file_data, tuple) and file_data and isinstance(file_data[0], str):
+			file_data = [file_data]
+
+		for cur_file in file_data:
+			if not isinstance(cur_file, tuple) or len(cur_file) not in (2, 3):
+				raise ValueError('file data must be a tuple in the form of (file name, file buffer, file type) or (file name, file buffer)')
+
+			file_name, file_buffer = cur_file[0], cur_file[1]
+			file_type = cur_file[2] if len(cur_file) == 3 else get_file_ext(file_name)
+			if file_type not in content_data:
+				raise ValueError(f'Invalid file type. Supported: {list(content_data.keys())}')
+
+			# file metadata prep
+			file_metadata = {
+				'name': file_name,
+				'parents': [dst_folder_id],
+				'driveId': self.main_drive_id
+			}
+
+			# try to move pointer to first byte in file buffer
+			if hasattr(file_buffer, 'seek'):
+				file_buffer.seek(0)
+			else:
+				raise ValueError('Incorrect tuple')
+
+			# MediaBaseUpload media object
+			media = MediaIoBaseUpload(
+				file_buffer,
+				mimetype=content_data[file_type]['content_type'],
+				resumable=True
+			)
+
+			# upload process
+			try:
 				if update_dup:
-					dup_files = self.drive_get_dup_files(dst_folder_id, file_name, log)
+					dup_files = self.drive_folder_index(dst_folder_id, index_ttl, log).get(file_name, [])
 
 					# update existing files or create new ones
 					if dup_files:
 						self.drive_update_file(media, dup_files, log)
 					else:
 						self.drive_create_file(file_metadata, media, log)
-
 				else:
 					self.drive_create_file(file_metadata, media, log)
-		except Exception as error:
-			print(f'Upload failed for {file_path}\n{error}') if log else 0
-			raise
+			except Exception as error:
+				print(f'Upload failed for {file_name}\n{error}') if log else 0
+				raise
 
-	# uploads a binary file data to Google Drive
-	# file data taken in the form of tuple: (file name, file buffer, file type)
-	def bin_file_to_drive(self, dst_folder_id:str, file_data:List[Tuple], update_dup=True, log=False):
-		# parsing check
-		if update_dup not in (True, False):
+	# upload many files concurrently: local file paths and/or (file name, file buffer[, file type]) tuples
+	# each worker thread uploads through its own service built by service_factory; without a service_factory
+	# there is only the one service, so the files are uploaded one at a time
+	# all workers share one Rate_Limiter, which backs off on 403/429 rate limit errors and speeds up again when they stop
+	# rate limited and 5xx responses are retried up to max_retries times with exponential backoff
+	# returns one dict per file: {'file_name', 'file_id', 'status', 'error', 'seconds', 'retries'}
+	def drive_upload_batch(self, dst_folder_id:str, file_data:Iterable, update_dup:bool=True, workers:int=8, rate_limiter:Rate_Limiter=None, max_retries:int=5, log:bool=False, ignore_error:bool=False, index_ttl:float=FOLDER_INDEX_TTL) -> List[dict]:
+		if not isinstance(update_dup, bool):
 			raise ValueError('Update dup must be value type <bool>')
-		if not isinstance(file_data, tuple) or len(file_data) != 3:
-			raise ValueError('file data must be a tuple of len = 3, in the form of (file name, file buffer, file type)')
-		if file_data[2] not in content_data:
-			raise ValueError(f'Invalid file type. Supported: {list(content_data.keys())}')
+		if self.service_factory is None:
+			workers = 1
+
+		rate_limiter = rate_limiter or Rate_Limiter()
+
+		# list the folder once up front and let every worker use that listing for the whole batch,
+		# so no worker re-lists it outside the retry loop when index_ttl runs out mid-batch
+		# files created by the batch are still added to it (see _index_created)
+		folder_index = self.drive_folder_index(dst_folder_id, index_ttl, log) if update_dup else {}
+
+		def upload_tasks():
+			for cur_file in file_data:
+				if isinstance(cur_file, str):
+					if not os.path.isfile(cur_file):
+						raise ValueError(f'{cur_file} is not a file')
+					file_name, file_source, file_type = os.path.basename(cur_file), cur_file, get_file_ext(cur_file)
+				elif isinstance(cur_file, tuple) and len(cur_file) in (2, 3) and hasattr(cur_file[1], 'seek'):
+					file_name, file_source = cur_file[0], cur_file[1]
+					file_type = cur_file[2] if len(cur_file) == 3 else get_file_ext(file_name)
+				else:
+					raise ValueError('file data must be a file path or a tuple in the form of (file name, file buffer, file type) or (file name, file buffer)')
+
+				if file_type not in content_data:
+					raise ValueError(f'Invalid file type. Supported: {list(content_data.keys())}')
+				yield file_name, (dst_folder_id, file_name, file_source, file_type, folder_index, rate_limiter, max_retries)
 
-		# file metadata prep
+		results = []
+		for file_name, upload_result, error, elapsed in _run_slices(self._upload_one, upload_tasks(), workers):
+			status, file_id, retries = upload_result if upload_result else ('failed', None, None)
+			results.append({
+				'file_name': file_name,
+				'file_id': file_id,
+				'status': status,
+				'error': error,
+				'seconds': elapsed,
+				'retries': retries
+			})
+
+			if error:
+				if log:
+					print(f'Upload failed for {file_name}\n{error}')
+				if workers <= 1 and not ignore_error:
+					raise error
+			elif log:
+				print(f'{datetime.now()} {status} {file_name} ({elapsed:.2f}s, {retries} retries, {rate_limiter})')
+
+		failed = [result for result in results if result['status'] == 'failed']
+		if failed and not ignore_error:
+			failed_names = ', '.join(result['file_name'] for result in failed)
+			raise RuntimeError(f'{len(failed)} of {len(results)} uploads to folder Id {dst_folder_id} failed: {failed_names}') from failed[0]['error']
+
+		return results
+
+	# upload one file from a worker thread; returns (status, file id, retries)
+	# folder_index is the batch's listing of dst_folder_id, empty without update_dup
+	def _upload_one(self, dst_folder_id:str, file_name:str, file_source, file_type:str, folder_index:dict, rate_limiter:Rate_Limiter, max_retries:int) -> tuple:
+		service = self._thread_service()
 		file_metadata = {
-			'name': file_data[0],
+			'name': file_name,
 			'parents': [dst_folder_id],
 			'driveId': self.main_drive_id
 		}
+		dup_files = folder_index.get(file_name, [])
 
-		# try to move pointer to first byte in file buffer
-		file_buffer = file_data[1]
-		if hasattr(file_buffer, 'seek'):
-			file_buffer.seek(0)
-		else:
-			raise ValueError('Incorrect tuple')
-
-		# MediaBaseUpload media object
-		media = MediaIoBaseUpload(
-			file_data[1], # file buffer
-			mimetype=content_data[file_data[2]]['content_type'],
-			resumable=True
-		)
+		for attempt in range(max_retries + 1):
+			rate_limiter.acquire()
+			try:
+				with (open(file_source, 'rb') if isinstance(file_source, str) else nullcontext(file_source)) as file:
+					file.seek(0)
+					media = MediaIoBaseUpload(file, mimetype=content_data[file_type]['content_type'], resumable=True)
+					if dup_files:
+						self.drive_update_file(media, dup_files, service=service)
+						status, file_id = 'updated', dup_files[0]['id']
+					else:
+						status, file_id = 'created', self.drive_create_file(file_metadata, media, service=service)['id']
+			except Exception as error:
+				rate_limited = _is_rate_limited(error)
+				if rate_limited:
+					rate_limiter.rate_limited()
+				if attempt == max_retries or not (rate_limited or _is_transient(error)):
+					raise
+				# exponential backoff with jitter, as recommended for the Drive API
+				time.sleep(min(32, 2 ** attempt) + random.random())
+				continue
 
-		# upload process
-		try:
-			if update_dup:
-				dup_files = self.drive_get_dup_files(dst_folder_id, file_data[0], log)
+			rate_limiter.success()
+			return status, file_id, attempt
 
-				# update existing files or create new ones
-				if dup_files:
-					self.drive_update_file(media, dup_files, log)
-				else:
-					self.drive_create_file(file_metadata, media, log)
-			else:
-				self.drive_create_file(file_metadata, media, log)
-		except Exception as error:
-			print(f'Upload failed for {file_metadata['name']}\n{error}') if log else 0
-			raise
+	# the service of the calling thread, built on first use
+	def _thread_service(self):
+		if self.service_factory is None:
+			return self.service
+		service = getattr(self._thread_local, 'service', None)
+		if service is None:
+			service = self._thread_local.service = self.service_factory()
+		return service
 
 	# =================
 	# = File download =
 	# =================
 
-	def download_file_from_drive(self, dst_folder_id:str):
-		pass
+	# download a Drive file in chunks of chunk_size bytes, straight into dst:
+	# a local file path, an existing directory (the file keeps its Drive name) or a writable binary buffer
+	# paths are written through <path>.<file id>.part and renamed once complete; with resume, the .part file left by
+	# an interrupted download of the same file is continued from its last byte
+	# verify_md5 checks the bytes against Drive's md5Checksum (Google Docs/Sheets have no binary content to download)
+	# returns the file metadata: {'id', 'name', 'mimeType', 'size', 'md5Checksum', 'path', 'resumed_from'}
+	def download_file_from_drive(self, file_id:str, dst, chunk_size:int=DOWNLOAD_CHUNK_SIZE, resume:bool=True, verify_md5:bool=True, log:bool=False) -> dict:
+		return self._download_file(file_id, dst, chunk_size, resume, verify_md5, log)
+
+	# claimed_paths: {local path: file id} shared by the downloads of one batch, so that files with the same
+	# Drive name downloaded into one directory get distinct paths - see drive_download_batch
+	def _download_file(self, file_id:str, dst, chunk_size:int, resume:bool, verify_md5:bool, log:bool, claimed_paths:dict=None) -> dict:
+		service = self._thread_service()
+		try:
+			file_metadata = service.files().get(
+				fileId=file_id,
+				fields='id, name, mimeType, size, md5Checksum',
+				supportsAllDrives=self.is_shared_drive
+			).execute()
+		except Exception as error:
+			if log:
+				print(f'Unable to read file Id {file_id}\n{error}')
+			raise
+
+		file_name = file_metadata['name']
+		if file_metadata.get('mimeType', '').startswith('application/vnd.google-apps.'):
+			raise ValueError(f"{file_name} is a Google Workspace file ({file_metadata['mimeType']}) and has no binary content to download")
+
+		expected_md5 = file_metadata.get('md5Checksum') if verify_md5 else None
+		file_hash = hashlib.md5() if expected_md5 else None
+		file_metadata['path'] = None
+		file_metadata['resumed_from'] = 0
+
+		# caller-supplied buffer: no resume
+		if not isinstance(dst, str):
+			self._download_chunks(service, file_id, dst, chunk_size, 0, file_hash, file_name, log)
+			_check_md5(file_name, file_hash, expected_md5)
+			return file_metadata
+
+		file_path = os.path.join(dst, file_name.replace(os.sep, '_')) if os.path.isdir(dst) else dst
+		if claimed_paths is not None and os.path.isdir(dst):
+			with self._download_paths_lock:
+				file_path = _claim_path(claimed_paths, file_path, file_id)
+		part_path = f'{file_path}.{file_id}.part'
+		file_size = int(file_metadata.get('size') or 0)
+		offset = os.path.getsize(part_path) if resume and os.path.isfile(part_path) else 0
+		if offset > file_size:
+			offset = 0
+		if os.path.dirname(file_path):
+			os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+		with open(part_path, 'r+b' if offset else 'wb') as part_file:
+			if offset:
+				if log:
+					print(f'{datetime.now()} resuming {file_name} from byte {offset} of {file_size}')
+				# the bytes already on disk are part of the checksum
+				while file_hash and part_file.tell() < offset:
+					file_hash.update(part_file.read(min(chunk_size, offset - part_file.tell())))
+				part_file.seek(offset)
+				part_file.truncate()
+			if offset < file_size or not file_size:
+				self._download_chunks(service, file_id, part_file, chunk_size, offset, file_hash, file_name, log)
+
+		try:
+			_check_md5(file_name, file_hash, expected_md5)
+		except ValueError:
+			os.remove(part_path)
+			# the file changed on Drive since the partial download, start over once
+			if offset:
+				if log:
+					print(f'{datetime.now()} partial download of {file_name} is out of date, downloading it again')
+				return self.download_file_from_drive(file_id, file_path, chunk_size, False, verify_md5, log)
+			raise
+
+		os.replace(part_path, file_path)
+		file_metadata['path'] = file_path
+		file_metadata['resumed_from'] = offset
+		if log:
+			print(f'{datetime.now()} downloaded {file_name} to {file_path}')
+		return file_metadata
+
+	# download many files concurrently into dst_dir
+	# files: Drive file ids, or (file id, local file name) tuples; files keep their Drive name by default
+	# Drive allows several files with the same name in a folder: a name already taken in the batch gets
+	# the file id appended (sales.csv -> sales_<file id>.csv); repeated local names raise a ValueError up front
+	# each worker thread downloads through its own service; without a service_factory, one file at a time (see drive_upload_batch)
+	# returns one dict per file: {'file_id', 'file_name', 'path', 'status', 'bytes', 'resumed_from', 'error', 'seconds'}
+	def drive_download_batch(self, files:Iterable, dst_dir:str, workers:int=4, chunk_size:int=DOWNLOAD_CHUNK_SIZE, resume:bool=True, verify_md5:bool=True, log:bool=False, ignore_error:bool=False) -> List[dict]:
+		if self.service_factory is None:
+			workers = 1
+		os.makedirs(dst_dir, exist_ok=True)
+
+		files = [(cur_file, None) if isinstance(cur_file, str) else tuple(cur_file) for cur_file in files]
+
+		# local names are claimed before any download starts, Drive names as each file's metadata arrives
+		claimed_paths = {}
+		for file_id, file_name in files:
+			if file_name:
+				file_path = os.path.join(dst_dir, file_name)
+				if file_path in claimed_paths:
+					raise ValueError(f'{file_name} is used as the local name of more than one file')
+				claimed_paths[file_path] = file_id
+
+		def download_tasks():
+			for file_id, file_name in files:
+				dst = os.path.join(dst_dir, file_name) if file_name else dst_dir
+				yield file_id, (file_id, dst, chunk_size, resume, verify_md5, log, claimed_paths)
+
+		results = []
+		for file_id, file_metadata, error, elapsed in _run_slices(self._download_file, download_tasks(), workers):
+			file_metadata = file_metadata or {}
+			results.append({
+				'file_id': file_id,
+				'file_name': file_metadata.get('name'),
+				'path': file_metadata.get('path'),
+				'status': 'failed' if error else 'downloaded',
+				'bytes': int(file_metadata.get('size') or 0),
+				'resumed_from': file_metadata.get('resumed_from', 0),
+				'error': error,
+				'seconds': elapsed
+			})
+
+			if error:
+				if log:
+					print(f'Download failed for file Id {file_id}\n{error}')
+				if workers <= 1 and not ignore_error:
+					raise error
+
+		failed = [result for result in results if result['status'] == 'failed']
+		if failed and not ignore_error:
+			failed_ids = ', '.join(result['file_id'] for result in failed)
+			raise RuntimeError(f'{len(failed)} of {len(results)} downloads failed: {failed_ids}') from failed[0]['error']
+
+		return results
+
+	# stream a file's content into file_obj from byte offset on, one chunk_size request at a time
+	def _download_chunks(self, service, file_id:str, file_obj, chunk_size:int, offset:int=0, file_hash=None, file_name:str='', log:bool=False):
+		request = service.files().get_media(fileId=file_id, supportsAllDrives=self.is_shared_drive)
+		downloader = MediaIoBaseDownload(_Hashing_Writer(file_obj, file_hash) if file_hash else file_obj, request, chunksize=chunk_size)
+		# MediaIoBaseDownload has no start offset argument; its next Range request starts at _progress
+		downloader._progress = offset
+
+		done = False
+		while not done:
+			progress, done = downloader.next_chunk(num_retries=3)
+			if log and progress.total_size:
+				print(f'{datetime.now()} {file_name} {progress.progress() * 100:.0f}%')
+
+	# read an xlsx file from Drive as DF chunks of chunk_row rows, without building the whole workbook or DF in memory
+	# drive_file: file id, or file data with an 'id' (e.g. from drive_search_filename)
+	# the workbook is downloaded into a temporary file that stays in memory up to spool_bytes, then parsed
+	# row by row with openpyxl in read-only mode; rows with no values at all are skipped
+	# usecols: column names (or positions if header=False) to keep; dtype: a dtype, or {column: dtype}, applied to every chunk
+	def read_excel_to_df(self, drive_file, sheet_name=None, chunk_row:int=100000, usecols:list=None, dtype=None, header:bool=True, spool_bytes:int=64*1024**2, log:bool=False) -> Iterator[pd.DataFrame]:
+		if chunk_row <= 0:
+			raise ValueError('Invalid chunk length.')
+
+		file_id = drive_file['id'] if isinstance(drive_file, dict) else drive_file
+		with SpooledTemporaryFile(max_size=spool_bytes) as workbook_file:
+			file_metadata = self.download_file_from_drive(file_id, workbook_file, log=log)
+			if get_file_ext(file_metadata['name']) not in ('.xlsx', '.xlsm'):
+				raise ValueError(f"{file_metadata['name']} is not an xlsx file")
+
+			workbook_file.seek(0)
+			workbook = openpyxl.load_workbook(workbook_file, read_only=True, data_only=True)
+			try:
+				worksheet = workbook.active if sheet_name is None else (workbook.worksheets[sheet_name] if isinstance(sheet_name, int) else workbook[sheet_name])
+				rows = (row for row in worksheet.iter_rows(values_only=True) if any(value is not None for value in row))
+
+				first_row = next(rows, None)
+				if first_row is None:
+					return
+				if header:
+					col_names = [f'Unnamed: {col_num}' if col_name is None else str(col_name) for col_num, col_name in enumerate(first_row)]
+				else:
+					col_names = list(range(len(first_row)))
+					rows = _chain_row(first_row, rows)
+
+				positions = _excel_col_positions(col_names, usecols)
+				selected_cols = [col_names[col_num] for col_num in positions]
+				if isinstance(dtype, dict):
+					dtype = {col_name: col_type for col_name, col_type in dtype.items() if col_name in selected_cols}
+
+				width = len(col_names)
+				chunk_rows = []
+				total_rows = 0
+				for row in rows:
+					if len(row) < width:
+						row = row + (None,) * (width - len(row))
+					chunk_rows.append([row[col_num] for col_num in positions])
+
+					if len(chunk_rows) == chunk_row:
+						total_rows += len(chunk_rows)
+						yield _excel_chunk(chunk_rows, selected_cols, dtype)
+						chunk_rows = []
+						if log:
+							print(f"{datetime.now()} read {total_rows} rows from {file_metadata['name']}")
+
+				if chunk_rows:
+					total_rows += len(chunk_rows)
+					yield _excel_chunk(chunk_rows, selected_cols, dtype)
+
+				if log:
+					print(f"{datetime.now()} finished reading {file_metadata['name']}: {total_rows} rows")
+			finally:
+				workbook.close()
+
+# fields mask with the required fields first, without repeats
+def _fields_mask(fields:str, required:list) -> str:
+	return ', '.join(dict.fromkeys(required + [field.strip() for field in fields.split(',') if field.strip()]))
+
+# quote a name for a Drive query string
+def _escape_query(name:str) -> str:
+	return name.replace('\\', '\\\\').replace("'", "\\'")
+
+# claim file_path for file_id in claimed_paths; a path already claimed by another download gets the file id
+# appended before the extension, and a counter as well if the same file id is downloaded more than once
+def _claim_path(claimed_paths:dict, file_path:str, file_id:str) -> str:
+	root, file_ext = os.path.splitext(file_path)
+	claimed_path, copy_num = file_path, 1
+	while claimed_path in claimed_paths:
+		claimed_path = f'{root}_{file_id}{file_ext}' if copy_num == 1 else f'{root}_{file_id}_{copy_num}{file_ext}'
+		copy_num += 1
+	claimed_paths[claimed_path] = file_id
+	return claimed_path
+
+# passes downloaded bytes on to file_obj, hashing them on the way
+class _Hashing_Writer:
+	def __init__(self, file_obj, file_hash):
+		self.file_obj = file_obj
+		self.file_hash = file_hash
+
+	def write(self, data) -> int:
+		self.file_hash.update(data)
+		return self.file_obj.write(data)
+
+def _check_md5(file_name:str, file_hash, expected_md5:str):
+	if file_hash is not None and file_hash.hexdigest() != expected_md5:
+		raise ValueError(f'Checksum mismatch for {file_name}: expected md5 {expected_md5}, got {file_hash.hexdigest()}')
+
+def _chain_row(first_row:tuple, rows):
+	yield first_row
+	yield from rows
+
+# positions of the usecols columns (names or positions) in col_names; all columns if usecols is None
+def _excel_col_positions(col_names:list, usecols:list=None) -> list:
+	if usecols is None:
+		return list(range(len(col_names)))
+
+	positions = []
+	for col in usecols:
+		if col in col_names:
+			positions.append(col_names.index(col))
+		elif isinstance(col, int) and 0 <= col < len(col_names):
+			positions.append(col)
+		else:
+			raise ValueError(f'Column {col} not found. Available: {col_names}')
+	return positions
 
-	def read_excel_to_df(self, dst_folder_id:str, file_metadata:tuple, log=False):
-		pass
+def _excel_chunk(chunk_rows:list, col_names:list, dtype=None) -> pd.DataFrame:
+	chunk_df = pd.DataFrame(chunk_rows, columns=col_names)
+	return chunk_df.astype(dtype) if dtype else chunk_df
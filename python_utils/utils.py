@@ -1,6 +1,10 @@
 import os
+import time
+import codecs
 import calendar
+from collections import deque
 from datetime import date, datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 '''
 Files and folders
@@ -36,11 +40,21 @@ def gen_file_name(prefix:str, infile_name:str, infile_type:str, outfile_type:str
 	final_file_name = f"{prefix}{file_name}{suffix}{outfile_type}"
 	return final_file_name
 
+# get the file extension, keeping compression suffixes with the inner extension (e.g. .csv.gz)
+def get_file_ext(file_name:str) -> str:
+	root, file_ext = os.path.splitext(file_name)
+	if file_ext in ('.gz',):
+		return os.path.splitext(root)[1] + file_ext
+	return file_ext
+
 # check if a file is plain text file (utf-8 encoding)
-def is_plain_text_file(file_path:str):
+# only the first sniff_bytes are read, so sniffing a multi-GB file costs one small read
+# the incremental decoder tolerates a multi-byte character cut off at the end of the sample
+def is_plain_text_file(file_path:str, sniff_bytes:int=65536):
+	with open(file_path, 'rb') as file:
+		sample = file.read(sniff_bytes)
 	try:
-		with open(file_path, 'r', encoding='utf-8') as file:
-			file.read()
+		codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
 		return True
 	except UnicodeDecodeError:
 		return False
@@ -79,3 +93,52 @@ String formatting
 '''
 def snake_case(col: str) -> str:
 	return col.lower().strip().replace(' ', '_').replace('-', '_')
+
+'''
+Worker pools
+'''
+# run a task and time it - module level so it can be sent to a process pool
+def _timed_call(task, *args):
+	start = time.perf_counter()
+	result = task(*args)
+	return result, time.perf_counter() - start
+
+# run task(*args) for every (name, args) pair in tasks, in order or on a worker pool
+# yields (name, result, error, seconds) in the original slice order so the _1, _2... naming is kept
+# workers <= 1 runs in the current thread; use_processes picks a process pool for CPU-bound encoders (xlsxwriter)
+def _run_slices(task, tasks, workers:int=1, use_processes:bool=False, log_label:str=None):
+	if workers <= 1:
+		for name, args in tasks:
+			if log_label:
+				print(f'{datetime.now()} creating {log_label} {name}')
+			try:
+				result, elapsed = _timed_call(task, *args)
+			except Exception as error:
+				yield name, None, error, 0.0
+				continue
+			yield name, result, None, elapsed
+		return
+
+	pool = ProcessPoolExecutor(max_workers=workers) if use_processes else ThreadPoolExecutor(max_workers=workers)
+	pending = deque()
+	try:
+		for name, args in tasks:
+			if log_label:
+				print(f'{datetime.now()} creating {log_label} {name}')
+			pending.append((name, pool.submit(_timed_call, task, *args)))
+
+			# cap the number of slices held in memory at once
+			while len(pending) >= workers * 2:
+				yield _collect_slice(*pending.popleft())
+
+		while pending:
+			yield _collect_slice(*pending.popleft())
+	finally:
+		pool.shutdown(wait=True, cancel_futures=True)
+
+def _collect_slice(name:str, future):
+	try:
+		result, elapsed = future.result()
+	except Exception as error:
+		return name, None, error, 0.0
+	return name, result, None, elapsed